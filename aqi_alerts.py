@@ -0,0 +1,350 @@
+# =========================
+# AQI ALERTING ENGINE
+# =========================
+# Consumes a stream of pollutant readings, scores them with the model in
+# micro-batches and evaluates per-city rules such as "Unhealthy for 3
+# consecutive hours". Rule windows are measured in time: a 3-interval window
+# covers the readings of the last 3 hours for the default one-hour interval,
+# so a gap in the stream breaks a run instead of joining readings hours
+# apart.
+#
+# Per-city state is a compact buffer of the last K category codes (int8) and
+# their timestamps, where K is the longest rule window. Each micro-batch is
+# sorted by (city, Date) and spliced onto those buffers city by city as one
+# flat array, and every rule is evaluated over it with array operations, so
+# no Python code runs per reading or per city. Readings no newer than the
+# last one seen for their city arrive too late to be placed and are counted
+# in `late`. Alerts fire when a rule's condition turns true, not on every
+# reading while it stays true; after a missed reading it can fire again.
+# Readings with a missing or non-numeric pollutant value, no site or no
+# parsable date are skipped, and a batch that still fails is counted in
+# `errors` / `last_error` without stopping the stream.
+#
+# Readings arrive as line-delimited JSON, e.g.
+#     {"Date": "2024-01-01T13:00", "Site Name (of Overall AQI)": "Delhi",
+#      "CO": 5.1, "Ozone": 40, "PM10": 30, "PM25": 80, "NO2": 25}
+# from a tailed file, a TCP socket, or an in-process queue:
+#
+#     python aqi_alerts.py --tail readings.ndjson --alerts alerts.ndjson
+#     python aqi_alerts.py --listen 127.0.0.1:9099 --alerts alerts.ndjson
+import os
+import sys
+import json
+import time
+import queue
+import pickle
+import socket
+import argparse
+import threading
+
+import numpy as np
+import pandas as pd
+
+import aqi_categories
+import aqi_monitoring
+from aqi_forest import ForestArrays
+
+SITE_COL = 'Site Name (of Overall AQI)'
+DATE_COL = 'Date'
+BATCH_ROWS = 4096
+BATCH_WAIT_SECONDS = 0.2
+TAIL_POLL_SECONDS = 0.5
+INTERVAL = "1h"
+NO_READING = -1
+# Timestamp of an empty history slot; far enough from int64 min that differences can't overflow
+NO_TIME = np.iinfo(np.int64).min // 2
+
+
+class AlertRule:
+    """
+    Fire when at least `min_count` readings within the last `window` intervals
+    (of the engine, an hour by default) are at `category` or worse.
+    """
+
+    def __init__(self, name, category, window=1, min_count=None):
+        if category not in aqi_categories.CATEGORY_NAMES:
+            raise ValueError(f"Unknown AQI category: {category}")
+        self.name = name
+        self.category = category
+        self.level = aqi_categories.CATEGORY_NAMES.index(category)
+        self.window = int(window)
+        self.min_count = int(min_count) if min_count is not None else self.window
+
+    @classmethod
+    def from_dict(cls, spec):
+        return cls(spec['name'], spec['category'], spec.get('window', 1), spec.get('min_count'))
+
+
+DEFAULT_RULES = [
+    AlertRule("Unhealthy for 3 consecutive hours", "Unhealthy", window=3),
+    AlertRule("Sensitive groups: 6 of the last 8 hours", "Unhealthy for Sensitive Groups", window=8, min_count=6),
+    AlertRule("Very Unhealthy reading", "Very Unhealthy", window=1),
+]
+
+
+def load_rules(path):
+    with open(path, 'r') as f:
+        return [AlertRule.from_dict(spec) for spec in json.load(f)]
+
+
+# =========================
+# SINKS
+# =========================
+class NDJSONSink:
+    """Appends alerts as JSON lines to a local file (or stdout for '-')."""
+
+    def __init__(self, path="-"):
+        self.file = sys.stdout if path == "-" else open(path, "a", encoding="utf-8")
+
+    def emit(self, alerts):
+        for alert in alerts:
+            self.file.write(json.dumps(alert) + "\n")
+        self.file.flush()
+
+
+class ListSink:
+    """Keeps every alert in memory; for tests and benchmarks, not long-running engines."""
+
+    def __init__(self):
+        self.alerts = []
+
+    def emit(self, alerts):
+        self.alerts.extend(alerts)
+
+
+# =========================
+# ENGINE
+# =========================
+class AlertEngine:
+    def __init__(self, forest, rules=None, sink=None, initial_cities=64, drift_monitor=None, interval=INTERVAL):
+        self.forest = forest
+        self.features = forest.feature_names
+        # Scored readings are also binned for drift monitoring, per city
+        self.drift_monitor = drift_monitor
+        self.rules = list(rules or DEFAULT_RULES)
+        self.sink = sink or NDJSONSink()
+        self.history_len = max(rule.window for rule in self.rules)
+        # Expected spacing of one city's readings, in nanoseconds
+        self.interval = pd.Timedelta(interval).value
+        self.city_ids = {}
+        self.city_names = []
+        # history[city] holds the last K category codes, oldest first, and history_times their timestamps
+        self.history = np.full((initial_cities, self.history_len), NO_READING, dtype=np.int8)
+        self.history_times = np.full((initial_cities, self.history_len), NO_TIME, dtype=np.int64)
+        self.readings = 0
+        self.late = 0
+        self.errors = 0
+        self.last_error = None
+
+    def _city_index(self, cities):
+        names, inverse = np.unique(np.asarray(cities, dtype=str), return_inverse=True)
+        for name in names:
+            if name not in self.city_ids:
+                self.city_ids[name] = len(self.city_names)
+                self.city_names.append(name)
+        ids = np.array([self.city_ids[name] for name in names], dtype=np.int64)[inverse.ravel()]
+        if len(self.city_names) > len(self.history):
+            shape = (max(len(self.city_names), 2 * len(self.history)), self.history_len)
+            grown = np.full(shape, NO_READING, dtype=np.int8)
+            grown[:len(self.history)] = self.history
+            grown_times = np.full(shape, NO_TIME, dtype=np.int64)
+            grown_times[:len(self.history)] = self.history_times
+            self.history, self.history_times = grown, grown_times
+        return ids
+
+    def _held(self, rule, sequence, times, pos):
+        # Whether the rule's condition holds at each position: hits among the `window` slots up to
+        # it that fall within `window` intervals of its timestamp. Empty slots have NO_TIME.
+        cutoff = times[pos] - rule.window * self.interval
+        hits = np.zeros(len(pos), dtype=np.int64)
+        for back in range(rule.window):
+            hits += (sequence[pos - back] >= rule.level) & (times[pos - back] > cutoff)
+        return hits >= rule.min_count
+
+    def process(self, readings):
+        """Score a micro-batch (DataFrame or list of dicts) and return the alerts it raised."""
+        if not isinstance(readings, pd.DataFrame):
+            readings = pd.DataFrame.from_records(readings)
+        if len(readings) == 0:
+            return []
+        if SITE_COL not in readings.columns and 'city' in readings.columns:
+            readings = readings.rename(columns={'city': SITE_COL})
+
+        # Missing columns and unparsable values become NaN / NaT, and those readings are skipped
+        X = (readings.reindex(columns=self.features).apply(pd.to_numeric, errors='coerce')
+             .to_numpy(dtype=np.float64))
+        site = readings[SITE_COL] if SITE_COL in readings.columns else pd.Series(np.nan, index=readings.index)
+        dates = (pd.to_datetime(readings[DATE_COL], errors='coerce', utc=True) if DATE_COL in readings.columns
+                 else pd.Series(pd.NaT, index=readings.index, dtype='datetime64[ns, UTC]'))
+        complete = ~np.isnan(X).any(axis=1) & site.notna().to_numpy() & dates.notna().to_numpy()
+        readings, X = readings[complete], X[complete]
+        if len(readings) == 0:
+            return []
+        times = dates[complete].dt.tz_localize(None).to_numpy(dtype='datetime64[ns]').view(np.int64)
+        city = self._city_index(readings[SITE_COL].to_numpy())
+
+        # Order by (city, time) whatever the arrival order; a reading no newer than the one before it
+        # (in this batch or the city's history) is late and dropped
+        order = np.lexsort((times, city))
+        city, times = city[order], times[order]
+        previous = np.empty_like(times)
+        previous[0] = NO_TIME
+        previous[1:] = np.where(city[1:] == city[:-1], times[:-1], NO_TIME)
+        on_time = (times > self.history_times[city, -1]) & (times > previous)
+        self.late += int((~on_time).sum())
+        order, city, times = order[on_time], city[on_time], times[on_time]
+        readings, X = readings.iloc[order], X[order]
+        if len(readings) == 0:
+            return []
+
+        if self.drift_monitor is not None and set(aqi_monitoring.POLLUTANTS) <= set(self.features):
+            columns = [self.features.index(name) for name in aqi_monitoring.POLLUTANTS]
+            self.drift_monitor.observe(X[:, columns], readings[SITE_COL].astype(str).to_numpy())
+        aqi = self.forest.predict(X)
+        codes = aqi_categories.category_index(aqi).astype(np.int8)
+        self.readings += len(readings)
+
+        # Lay out [history(K), this batch's readings] per city, cities back to back
+        K = self.history_len
+        unique_cities, first, counts = np.unique(city, return_index=True, return_counts=True)
+        block_start = np.concatenate([[0], np.cumsum(counts + K)[:-1]])
+        group = np.repeat(np.arange(len(unique_cities)), counts)
+        rank = np.arange(len(city)) - first[group]
+
+        sequence = np.empty(len(city) + K * len(unique_cities), dtype=np.int8)
+        sequence_times = np.empty(len(sequence), dtype=np.int64)
+        history_pos = block_start[:, None] + np.arange(K)
+        sequence[history_pos] = self.history[unique_cities]
+        sequence_times[history_pos] = self.history_times[unique_cities]
+        batch_pos = block_start[group] + K + rank
+        sequence[batch_pos] = codes
+        sequence_times[batch_pos] = times
+
+        # The reading before each one continues its run unless a reading was missed in between
+        continues = times - sequence_times[batch_pos - 1] < 2 * self.interval
+
+        alerts = []
+        for rule in self.rules:
+            # Windows ending at each reading and at the reading before it stay inside the
+            # city's block because K >= window
+            now = self._held(rule, sequence, sequence_times, batch_pos)
+            before = self._held(rule, sequence, sequence_times, batch_pos - 1) & continues
+            for row in np.flatnonzero(now & ~before):
+                alerts.append({
+                    'rule': rule.name,
+                    'city': self.city_names[city[row]],
+                    'date': str(readings[DATE_COL].iloc[row]),
+                    'predicted_aqi': round(float(aqi[row]), 1),
+                    'category': aqi_categories.CATEGORY_NAMES[codes[row]],
+                })
+
+        # Keep the newest K codes and timestamps of every city that appeared in the batch
+        newest = (block_start + K + counts)[:, None] - K + np.arange(K)
+        self.history[unique_cities] = sequence[newest]
+        self.history_times[unique_cities] = sequence_times[newest]
+
+        if alerts:
+            self.sink.emit(alerts)
+        return alerts
+
+    def run(self, readings_queue, stop_event=None, max_rows=BATCH_ROWS, max_wait=BATCH_WAIT_SECONDS):
+        """Pull readings from a queue and process them in micro-batches until stopped."""
+        while stop_event is None or not stop_event.is_set():
+            batch = []
+            deadline = time.monotonic() + max_wait
+            while len(batch) < max_rows:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(readings_queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self.process(batch)
+                except Exception as e:
+                    # One bad batch must not stop the consumer while readings keep arriving
+                    self.errors += 1
+                    self.last_error = str(e)
+
+
+# =========================
+# SOURCES
+# =========================
+def tail_file(path, readings_queue, stop_event=None, from_start=False):
+    """Follow a line-delimited JSON file (like `tail -f`) and queue each reading."""
+    with open(path, "r", encoding="utf-8") as f:
+        if not from_start:
+            f.seek(0, os.SEEK_END)
+        partial = ""
+        while stop_event is None or not stop_event.is_set():
+            line = f.readline()
+            if not line:
+                time.sleep(TAIL_POLL_SECONDS)
+                continue
+            partial += line
+            if not partial.endswith("\n"):
+                continue
+            if partial.strip():
+                try:
+                    readings_queue.put(json.loads(partial))
+                except ValueError:
+                    pass
+            partial = ""
+
+
+def listen_socket(host, port, readings_queue, stop_event=None):
+    """Accept TCP connections that send line-delimited JSON readings."""
+    server = socket.create_server((host, port))
+    server.settimeout(1.0)
+
+    def handle(conn):
+        with conn, conn.makefile("r", encoding="utf-8") as lines:
+            for line in lines:
+                if line.strip():
+                    try:
+                        readings_queue.put(json.loads(line))
+                    except ValueError:
+                        pass
+
+    while stop_event is None or not stop_event.is_set():
+        try:
+            conn, _ = server.accept()
+        except socket.timeout:
+            continue
+        threading.Thread(target=handle, args=(conn,), daemon=True).start()
+    server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate AQI alert rules over streaming readings")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--tail", help="line-delimited JSON file to follow")
+    source.add_argument("--listen", help="host:port to accept line-delimited JSON on")
+    parser.add_argument("--from-start", action="store_true", help="read the tailed file from the beginning")
+    parser.add_argument("--model", default="air_pollution_model.pkl")
+    parser.add_argument("--rules", help="JSON list of {name, category, window, min_count}")
+    parser.add_argument("--interval", default=INTERVAL, help="expected spacing of a city's readings, e.g. 1h or 15min")
+    parser.add_argument("--alerts", default="-", help="alert output file ('-' for stdout)")
+    parser.add_argument("--drift-report", help="write the input drift report to this CSV on exit")
+    args = parser.parse_args()
+
+    with open(args.model, "rb") as f:
+        engine_forest = ForestArrays.from_model(pickle.load(f))
+    engine = AlertEngine(engine_forest, load_rules(args.rules) if args.rules else None, NDJSONSink(args.alerts),
+                         drift_monitor=aqi_monitoring.default_monitor(), interval=args.interval)
+
+    incoming = queue.Queue()
+    if args.tail:
+        reader = threading.Thread(target=tail_file, args=(args.tail, incoming, None, args.from_start), daemon=True)
+    else:
+        host, port = args.listen.rsplit(":", 1)
+        reader = threading.Thread(target=listen_socket, args=(host, int(port), incoming), daemon=True)
+    reader.start()
+    try:
+        engine.run(incoming)
+    except KeyboardInterrupt:
+        pass
+    if args.drift_report and engine.drift_monitor is not None:
+        engine.drift_monitor.report().to_csv(args.drift_report, index=False)
@@ -9,11 +9,22 @@ import plotly.express as px
 import plotly.graph_objects as go
 import json
 import datetime
+import os
+import threading
 from datetime import datetime as dt
 import warnings
 warnings.filterwarnings('ignore')
 from PIL import Image
 from streamlit_option_menu import option_menu
+import aqi_store
+import aqi_registry
+import aqi_monitoring
+import aqi_categories
+import aqi_spatial
+import aqi_export
+import aqi_figures
+import aqi_city
+from aqi_forest import ForestArrays, PathExplainer
 
 # =========================
 # PAGE CONFIGURATION
@@ -131,16 +142,21 @@ st.subheader("Prediction of Air Pollution Using Machine Learning")
 # =========================
 # SIDEBAR NAVIGATION
 # =========================
+PAGES = ["Home", "AQI Prediction", "Historical Data", "City Analysis", "AQI Map", "About"]
+
+# ?page=<name> opens a page directly (bookmarks, and loadtest_app.py sessions)
+requested_page = st.query_params.get("page")
+
 with st.sidebar:
     if icon:
         st.sidebar.image(icon, use_container_width=True)
 
     selected = option_menu(
         menu_title="🌍 Navigation",
-        options=["Home", "AQI Prediction", "Historical Data", "City Analysis", "About"],
-        icons=["house", "speedometer2", "clock-history", "building", "info-circle"],
+        options=PAGES,
+        icons=["house", "speedometer2", "clock-history", "building", "map", "info-circle"],
         menu_icon="cast",
-        default_index=0,
+        default_index=PAGES.index(requested_page) if requested_page in PAGES else 0,
         styles={
             "container": {"padding": "5px", "background-color": "#f8f9fa"},
             "icon": {"color": "orange", "font-size": "18px"},
@@ -170,8 +186,35 @@ def load_model():
         st.error("Model file not found. Please train the model first.")
         return None
 
-@st.cache_data
-def load_visualization_data():
+def prepare_forest(model, version=None):
+    # Flatten the trees and precompute per-node contributions once per model load
+    forest = ForestArrays.from_model(model, version=version)
+    return forest, PathExplainer(forest)
+
+@st.cache_resource
+def get_model_watcher():
+    # One watcher per server process; it follows the registry's CURRENT version in the background
+    return aqi_registry.ModelWatcher(
+        on_load=lambda model, metadata: prepare_forest(model, metadata['version'])
+    ).start()
+
+@st.cache_resource
+def load_fallback_forest():
+    model = load_model()
+    return prepare_forest(model) if model is not None else (None, None)
+
+def get_active_model():
+    # Returns (model, version, forest, explainer); falls back to the fixed model file when the
+    # registry is empty
+    active = get_model_watcher().current()
+    if active is not None:
+        version, model, metadata, (forest, explainer) = active
+        return model, version, forest, explainer
+    return (load_model(), None) + load_fallback_forest()
+
+@st.cache_data(max_entries=2)
+def load_visualization_data(csv_version):
+    # csv_version (see data_versions) is the cache key, so a changed CSV is read again
     try:
         data = pd.read_csv("aqi_visualization_data.csv", parse_dates=['Date'])
         return data
@@ -179,6 +222,98 @@ def load_visualization_data():
         st.warning("Historical data not available. Run data processing script first.")
         return None
 
+@st.cache_resource(max_entries=2)
+def get_city_columns(history_version, _manifest):
+    # Per-city column blocks, rebuilt only when the history changes. They come from the store
+    # manifest history_version belongs to (not hashed), or from the CSV read here when there is
+    # no store, so the blocks always match history_version and the Historical Data page.
+    try:
+        if _manifest is not None:
+            return aqi_city.CityColumns.from_store(_manifest)
+        data = pd.read_csv(aqi_figures.CSV_PATH, parse_dates=['Date'])
+    except Exception:
+        return None
+    return aqi_city.CityColumns(data)
+
+@st.cache_data(ttl=60)
+def load_history_manifest():
+    # Re-read periodically so newly ingested partitions show up. An empty store counts as
+    # no store, so pages fall back to the CSV.
+    manifest = aqi_store.load_manifest()
+    if manifest is None or aqi_store.store_summary(manifest) is None:
+        return None
+    return manifest
+
+@st.cache_data(max_entries=32)
+def load_history(columns, from_date, to_date, cities, store_version):
+    # store_version is part of the cache key so a rebuilt store is never served stale; only the
+    # most recent filter selections are kept, each holds a full slice of the history
+    return aqi_store.query_history(list(columns), from_date, to_date, list(cities))
+
+def data_versions():
+    # (store manifest, history version, CSV version), taken once per rerun. Pages load their data
+    # from this snapshot and key cached figures on its versions, so figures never end up under a
+    # newer version than the data they were built from. The CSV is stat'ed before it is read.
+    manifest = load_history_manifest()
+    csv_version = (aqi_figures.file_version(aqi_figures.CSV_PATH)
+                   if os.path.exists(aqi_figures.CSV_PATH) else None)
+    history_version = manifest['version'] if manifest is not None else csv_version
+    return manifest, history_version, csv_version
+
+def load_filtered_history(columns, from_date, to_date, cities, manifest, csv_version):
+    if manifest is not None:
+        return load_history(tuple(columns), from_date, to_date, tuple(cities), manifest['version'])
+
+    # Fall back to the single CSV when no partitioned store has been built
+    data = load_visualization_data(csv_version)
+    if data is None:
+        return None
+    if from_date and to_date:
+        data = data[(data['Date'].dt.date >= from_date) & (data['Date'].dt.date <= to_date)]
+    if cities:
+        data = data[data['Site Name (of Overall AQI)'].isin(cities)]
+    return data
+
+@st.cache_resource(max_entries=2)
+def get_spatial_engine(history_version, csv_version, _manifest):
+    # Grid weights are computed once per process; history_version rebuilds it when new data lands
+    # (the manifest it came from is passed along but, being underscored, isn't hashed). Only the
+    # current and previous versions are kept.
+    try:
+        site_registry = aqi_spatial.load_site_registry()
+    except Exception:
+        return None
+    history = load_filtered_history(['Overall AQI Value'], None, None, [], _manifest, csv_version)
+    if history is None:
+        return None
+    return aqi_spatial.SpatialAQIEngine(history, aqi_spatial.IDWGrid(site_registry)), site_registry
+
+@st.cache_resource
+def get_figure_cache():
+    # Serialized figures shared by all sessions in this server process
+    return aqi_figures.FigureCache()
+
+@st.cache_resource
+def get_precompute_state():
+    # Stop event of the latest precompute job in this process
+    return {'lock': threading.Lock(), 'stop_event': None}
+
+@st.cache_resource(max_entries=2)
+def start_figure_precompute(history_version, csv_version):
+    # Runs once per data version and stops the job for the previous one; the versions are only
+    # here as the cache key (the job reads the current data itself), and only recent ones are kept
+    state = get_precompute_state()
+    with state['lock']:
+        if state['stop_event'] is not None:
+            state['stop_event'].set()
+        thread, state['stop_event'] = aqi_figures.start_precompute(get_figure_cache())
+    return thread
+
+def figure_cache_for_data(history_version, csv_version):
+    # The shared figure cache, making sure the common views for these versions are being precomputed
+    start_figure_precompute(history_version, csv_version)
+    return get_figure_cache()
+
 @st.cache_data
 def load_pollutant_stats():
     try:
@@ -187,6 +322,11 @@ def load_pollutant_stats():
     except:
         return None
 
+@st.cache_resource
+def get_drift_monitor():
+    # Shared by all sessions; reference histograms come from the training data
+    return aqi_monitoring.default_monitor()
+
 @st.cache_data
 def load_example_scenarios():
     try:
@@ -297,7 +437,7 @@ elif selected == "AQI Prediction":
     st.title("📊 Air Pollution Prediction Dashboard")
 
     # Load model and data
-    model = load_model()
+    model, model_version, forest, explainer = get_active_model()
     pollutant_stats = load_pollutant_stats()
     example_scenarios = load_example_scenarios()
 
@@ -460,11 +600,34 @@ elif selected == "AQI Prediction":
             # Make prediction
             try:
                 input_data = np.array([[co_val, o3_val, pm10_val, pm25_val, no2_val]])
-                prediction = model.predict(input_data)
-                aqi_value = int(prediction[0])
+                # One pass over all trees gives the prediction and its spread
+                distribution = forest.predict_distribution(
+                    input_data, thresholds=aqi_categories.CATEGORY_BOUNDARIES
+                )
+                aqi_value = int(distribution['mean'][0])
+                st.session_state.prediction_interval = (
+                    float(distribution['quantiles'][0.05][0]),
+                    float(distribution['quantiles'][0.95][0]),
+                    float(distribution['std'][0]),
+                )
+                st.session_state.prediction_exceedance = distribution['exceedance'][0].tolist()
+                st.session_state.prediction_contributions = explainer.explain(input_data)[0].tolist()
+                st.session_state.prediction_bias = explainer.bias
+
+                # Queue the inputs for drift monitoring (binned in the background)
+                drift_monitor = get_drift_monitor()
+                if drift_monitor is not None:
+                    drift_monitor.observe(input_data)
+                    outside = aqi_monitoring.outside_envelope(input_data, drift_monitor.reference.low,
+                                                              drift_monitor.reference.high)[0]
+                    st.session_state.extrapolated = [
+                        (name, float(input_data[0, j]), drift_monitor.reference.low[j], drift_monitor.reference.high[j])
+                        for j, name in enumerate(aqi_monitoring.POLLUTANTS) if outside[j]
+                    ]
 
                 # Store in session
                 st.session_state.prediction = aqi_value
+                st.session_state.prediction_model_version = model_version
                 st.session_state.show_result = True
             except Exception as e:
                 st.error(f"Prediction error: {e}")
@@ -474,7 +637,9 @@ elif selected == "AQI Prediction":
         if st.button("🔄 Reset", key="reset_prediction", use_container_width=True, 
                     type="secondary"):
             # Clear session state for this page
-            keys_to_clear = ['co', 'o3', 'pm10', 'pm25', 'no2', 'prediction', 'show_result']
+            keys_to_clear = ['co', 'o3', 'pm10', 'pm25', 'no2', 'prediction', 'prediction_model_version',
+                             'prediction_interval', 'prediction_exceedance', 'prediction_contributions',
+                             'prediction_bias', 'extrapolated', 'show_result']
             for key in keys_to_clear:
                 if key in st.session_state:
                     del st.session_state[key]
@@ -486,47 +651,68 @@ elif selected == "AQI Prediction":
         aqi_value = st.session_state.prediction
 
         # AQI Categories
-        if aqi_value <= 50:
-            category = "Good"
-            color = "#00E400"
-            icon = "😊"
-            advice = "Air quality is satisfactory"
-        elif aqi_value <= 100:
-            category = "Moderate"
-            color = "#FFFF00"
-            icon = "😐"
-            advice = "Acceptable air quality"
-        elif aqi_value <= 150:
-            category = "Unhealthy for Sensitive Groups"
-            color = "#FF7E00"
-            icon = "😷"
-            advice = "Sensitive groups should take caution"
-        elif aqi_value <= 200:
-            category = "Unhealthy"
-            color = "#FF0000"
-            icon = "😟"
-            advice = "Everyone may be affected"
-        elif aqi_value <= 300:
-            category = "Very Unhealthy"
-            color = "#8F3F97"
-            icon = "🚨"
-            advice = "Health alert"
-        else:
-            category = "Hazardous"
-            color = "#7E0023"
-            icon = "⚠️"
-            advice = "Emergency conditions"
-
-        # Display result in card
-        st.markdown(f"""
-        <div class="card" style="border-left: 10px solid {color};">
-            <div style="text-align: center;">
-                <h1 style="color: {color}; margin: 0;">{icon} AQI: {aqi_value}</h1>
-                <h3 style="color: {color}; margin: 10px 0;">{category}</h3>
-                <p style="font-size: 16px;">{advice}</p>
+        category, color, icon, advice = aqi_categories.categorize(aqi_value)
+
+        # Display result in card, with the per-pollutant breakdown alongside
+        result_col, explain_col = st.columns([1, 1])
+
+        with result_col:
+            st.markdown(f"""
+            <div class="card" style="border-left: 10px solid {color};">
+                <div style="text-align: center;">
+                    <h1 style="color: {color}; margin: 0;">{icon} AQI: {aqi_value}</h1>
+                    <h3 style="color: {color}; margin: 10px 0;">{category}</h3>
+                    <p style="font-size: 16px;">{advice}</p>
+                </div>
             </div>
-        </div>
-        """, unsafe_allow_html=True)
+            """, unsafe_allow_html=True)
+
+            # Spread of the individual trees' predictions
+            if 'prediction_interval' in st.session_state:
+                lower, upper, spread = st.session_state.prediction_interval
+                st.markdown(f"**90% interval:** {lower:.0f} – {upper:.0f} &nbsp; (std {spread:.1f})")
+
+                exceedance = st.session_state.get('prediction_exceedance', [])
+                exceedance_df = pd.DataFrame({
+                    'Category (or worse)': aqi_categories.CATEGORY_NAMES[1:],
+                    'AQI above': aqi_categories.CATEGORY_BOUNDARIES.astype(int),
+                    'Probability': [f"{p:.0%}" for p in exceedance],
+                })
+                st.dataframe(exceedance_df, use_container_width=True, hide_index=True)
+
+        with explain_col:
+            contributions = st.session_state.get('prediction_contributions')
+            if contributions is not None:
+                # Which pollutant pushed this prediction up or down from the model's average
+                contribution_df = pd.DataFrame({
+                    'Pollutant': forest.feature_names or aqi_monitoring.POLLUTANTS,
+                    'Contribution': contributions,
+                }).sort_values('Contribution')
+                fig = px.bar(contribution_df, x='Contribution', y='Pollutant', orientation='h',
+                             color='Contribution', color_continuous_scale='RdYlGn_r',
+                             title=f"What drove this prediction (baseline AQI {st.session_state.prediction_bias:.1f})")
+                fig.update_layout(coloraxis_showscale=False, height=300)
+                st.plotly_chart(fig, use_container_width=True)
+
+        prediction_version = st.session_state.get('prediction_model_version')
+        st.caption(f"Model version: {prediction_version or 'air_pollution_model.pkl'}")
+
+        # Warn when the model is extrapolating beyond the data it was trained on
+        for name, value, low, high in st.session_state.get('extrapolated', []):
+            st.warning(f"{name} = {value:g} is outside the training range ({low:g} – {high:g}); "
+                       f"this prediction is an extrapolation.")
+
+    # Drift of submitted inputs against the training distribution
+    drift_monitor = get_drift_monitor()
+    if drift_monitor is not None:
+        with st.expander("📡 Input Drift Monitor"):
+            drift_report = drift_monitor.report()
+            if len(drift_report) == 0:
+                st.info("No predictions have been made yet.")
+            else:
+                st.dataframe(drift_report, use_container_width=True)
+                st.caption("PSI < 0.1 stable, 0.1–0.25 moderate drift, > 0.25 significant drift; "
+                           f"drift is only scored after {aqi_monitoring.MIN_READINGS} readings")
 
 # =========================
 # HISTORICAL DATA PAGE
@@ -535,16 +721,23 @@ elif selected == "AQI Prediction":
 elif selected == "Historical Data":
     st.title("📊 Historical Data Explorer")
 
-    viz_data = load_visualization_data()
+    # Prefer the partitioned store: its manifest gives the date range and cities
+    # without reading any data
+    history_manifest, history_version, csv_version = data_versions()
+    viz_data = None if history_manifest is not None else load_visualization_data(csv_version)
 
-    if viz_data is not None:
+    if history_manifest is not None or viz_data is not None:
         # Initialize session state for filters if not exists
         if 'filters_applied' not in st.session_state:
             st.session_state.filters_applied = False
 
-        # Get min and max dates from data
-        min_date = viz_data['Date'].min().date()
-        max_date = viz_data['Date'].max().date()
+        # Get min and max dates and the city list
+        if history_manifest is not None:
+            min_date, max_date, cities = aqi_store.store_summary(history_manifest)
+        else:
+            min_date = viz_data['Date'].min().date()
+            max_date = viz_data['Date'].max().date()
+            cities = sorted(viz_data['Site Name (of Overall AQI)'].unique())
 
         # Use session state values or defaults
         from_date_value = st.session_state.get('from_date_value', min_date)
@@ -566,13 +759,11 @@ elif selected == "Historical Data":
                                    key="to_date_widget")
 
         with col3:
-            if 'Site Name (of Overall AQI)' in viz_data.columns:
-                cities = sorted(viz_data['Site Name (of Overall AQI)'].unique())
-                # Get selected cities from session state or default to empty list
-                default_cities = st.session_state.get('selected_cities_value', [])
-                selected_cities = st.multiselect("Select Cities:", cities, 
-                                                default=default_cities,
-                                                key="cities_widget")
+            # Get selected cities from session state or default to empty list
+            default_cities = st.session_state.get('selected_cities_value', [])
+            selected_cities = st.multiselect("Select Cities:", cities, 
+                                            default=default_cities,
+                                            key="cities_widget")
 
         with col4:
             pollutant_options = ['CO', 'Ozone', 'PM10', 'PM25', 'NO2', 'Overall AQI Value']
@@ -614,8 +805,6 @@ elif selected == "Historical Data":
             st.rerun()
 
         # Apply filters if set
-        filtered_data = viz_data.copy()
-
         if st.session_state.get('filters_applied', False):
             # Get values from session state
             from_date_val = st.session_state.get('from_date_value')
@@ -623,14 +812,13 @@ elif selected == "Historical Data":
             selected_cities_val = st.session_state.get('selected_cities_value', [])
             selected_pollutant_val = st.session_state.get('selected_pollutant_value', 'Overall AQI Value')
 
-            if from_date_val and to_date_val:
-                filtered_data = filtered_data[
-                    (filtered_data['Date'].dt.date >= from_date_val) & 
-                    (filtered_data['Date'].dt.date <= to_date_val)
-                ]
-
-            if selected_cities_val:
-                filtered_data = filtered_data[filtered_data['Site Name (of Overall AQI)'].isin(selected_cities_val)]
+            # Only the chosen pollutant and the AQI column (plus Date and site) are read,
+            # and only from partitions overlapping the chosen cities and dates
+            filtered_data = load_filtered_history(
+                [selected_pollutant_val, 'Overall AQI Value'],
+                from_date_val, to_date_val, selected_cities_val,
+                history_manifest, csv_version
+            )
 
             # Display results
             st.markdown(f"**Showing:** {len(filtered_data):,} records")
@@ -638,43 +826,46 @@ elif selected == "Historical Data":
             if len(filtered_data) == 0:
                 st.warning("No data found with the selected filters. Try different filters.")
             else:
+                # Figures come from the shared cache while the filters and data are unchanged
+                figure_cache = figure_cache_for_data(history_version, csv_version)
+
+                def history_figure(figure, aggregation='mean'):
+                    return aqi_figures.history_figure(figure_cache, figure, filtered_data, from_date_val,
+                                                      to_date_val, selected_cities_val, selected_pollutant_val,
+                                                      history_version, aggregation)
+
                 # Tabs - Now 4 tabs with City-wise AQI added
                 tab1, tab2, tab3, tab4 = st.tabs(["Time Trends", "City Comparison", "City-wise AQI", "Statistics"])
 
                 with tab1:
                     st.subheader("📈 Time Series Analysis")
 
-                    fig = px.line(filtered_data.sort_values('Date'), x='Date', y=selected_pollutant_val,
-                                color='Site Name (of Overall AQI)' if 'Site Name (of Overall AQI)' in filtered_data.columns else None,
-                                title=f'{selected_pollutant_val} Over Time')
+                    aggregation_options = {'Average': 'mean', 'Maximum': 'max', 'Max 8-hour Average': 'max8h'}
+                    aggregation = st.radio("Aggregation:", list(aggregation_options), horizontal=True,
+                                           key="trend_aggregation")
+
+                    # Long ranges (or hourly data) are plotted at a coarser resolution
+                    fig = history_figure('trend', aggregation_options[aggregation])
+                    st.caption(f"Resolution: {fig['layout']['meta']['resolution']}")
                     st.plotly_chart(fig, use_container_width=True)
 
                 with tab2:
                     st.subheader("🌍 City Comparison")
 
                     if 'Site Name (of Overall AQI)' in filtered_data.columns:
-                        city_stats = filtered_data.groupby('Site Name (of Overall AQI)')[selected_pollutant_val].agg(['mean', 'min', 'max']).round(2)
+                        city_stats = filtered_data.groupby('Site Name (of Overall AQI)', observed=True)[selected_pollutant_val].agg(['mean', 'min', 'max']).round(2)
                         st.dataframe(city_stats, use_container_width=True)
 
-                        fig = px.bar(city_stats.reset_index(), x='Site Name (of Overall AQI)', y='mean',
-                                    title=f'Average {selected_pollutant_val} by City')
-                        st.plotly_chart(fig, use_container_width=True)
+                        st.plotly_chart(history_figure('comparison'), use_container_width=True)
 
                 with tab3:
                     st.subheader("🏙️ City-wise AQI Distribution")
 
                     # City-wise AQI average
-                    city_avg = filtered_data.groupby('Site Name (of Overall AQI)')['Overall AQI Value'].mean().reset_index()
+                    city_avg = filtered_data.groupby('Site Name (of Overall AQI)', observed=True)['Overall AQI Value'].mean().reset_index()
 
                     # Create bar chart
-                    fig = px.bar(city_avg, x='Site Name (of Overall AQI)', y='Overall AQI Value',
-                                title='Average AQI by City', 
-                                color='Site Name (of Overall AQI)',
-                                text='Overall AQI Value',
-                                color_discrete_sequence=px.colors.qualitative.Set2)
-                    fig.update_traces(texttemplate='%{text:.1f}', textposition='outside')
-                    fig.update_layout(xaxis_title="City", yaxis_title="Average AQI")
-                    st.plotly_chart(fig, use_container_width=True)
+                    st.plotly_chart(history_figure('city_aqi'), use_container_width=True)
 
                     # Display city statistics
                     st.subheader("City-wise AQI Statistics")
@@ -699,8 +890,51 @@ elif selected == "Historical Data":
                     with col4:
                         st.metric("Maximum", f"{filtered_data[selected_pollutant_val].max():.2f}")
 
-                    fig = px.histogram(filtered_data, x=selected_pollutant_val, title='Distribution')
-                    st.plotly_chart(fig, use_container_width=True)
+                    st.plotly_chart(history_figure('distribution'), use_container_width=True)
+
+                # Export the filtered view; rows are encoded from the store chunk by chunk. The
+                # download button needs the whole file, so in-app exports are size-capped and
+                # kept in this session only (larger ones: aqi_export.py or the server's /export)
+                st.markdown("---")
+                st.subheader("⬇️ Export Filtered Data")
+
+                col1, col2, col3, col4 = st.columns(4)
+                with col1:
+                    export_format = st.selectbox("Format:", list(aqi_export.FORMATS), key="export_format")
+                with col2:
+                    export_compression = st.selectbox("Compression:", aqi_export.COMPRESSIONS,
+                                                      key="export_compression")
+                with col3:
+                    export_predictions = st.checkbox("Include model predictions", key="export_predictions")
+                with col4:
+                    prepare_pressed = st.button("Prepare Export", use_container_width=True)
+
+                if prepare_pressed:
+                    export_columns = [selected_pollutant_val, 'Overall AQI Value']
+                    _, _, export_forest, _ = get_active_model()
+                    if export_predictions and export_forest is not None:
+                        export_columns += export_forest.feature_names
+                    chunks = aqi_export.iter_chunks(export_columns, from_date_val, to_date_val,
+                                                    selected_cities_val)
+                    if export_predictions and export_forest is not None:
+                        chunks = aqi_export.with_predictions(chunks, export_forest,
+                                                             export_forest.feature_names)
+
+                    # Replaces any earlier export from this session
+                    st.session_state.pop('export_data', None)
+                    try:
+                        st.session_state.export_data = aqi_export.export_bytes(chunks, export_format,
+                                                                               export_compression)
+                        st.session_state.export_name = aqi_export.export_filename(
+                            f"aqi_{from_date_val}_{to_date_val}", export_format, export_compression)
+                        st.session_state.export_mime = aqi_export.MIME_TYPES[export_format]
+                    except ValueError as e:
+                        st.error(f"Export failed: {e}")
+
+                if 'export_data' in st.session_state:
+                    st.download_button(f"Download {st.session_state.export_name}", st.session_state.export_data,
+                                       file_name=st.session_state.export_name,
+                                       mime=st.session_state.export_mime, key="export_download")
         else:
             if not reset_pressed:  # Don't show this message when resetting
                 st.info("👆 Please select filters and click 'Apply Filters & Analyze' to see the data.")
@@ -715,14 +949,16 @@ elif selected == "Historical Data":
 elif selected == "City Analysis":
     st.title("🏙️ City-wise Air Pollution Analysis")
 
-    viz_data = load_visualization_data()
+    history_manifest, history_version, csv_version = data_versions()
+    figure_cache = figure_cache_for_data(history_version, csv_version)
+    city_columns = get_city_columns(history_version, history_manifest)
 
-    if viz_data is not None:
+    if city_columns is not None:
         # City selection with Reset button
         col1, col2 = st.columns([3, 1])
 
         with col1:
-            cities = sorted(viz_data['Site Name (of Overall AQI)'].unique())
+            cities = city_columns.cities
             selected_city = st.selectbox("Select a City:", cities, key="city_select")
 
         with col2:
@@ -737,42 +973,75 @@ elif selected == "City Analysis":
                 st.rerun()
 
         if selected_city:
-            city_data = viz_data[viz_data['Site Name (of Overall AQI)'] == selected_city]
+            # Metrics, monthly and pollutant averages in one pass over the city's slice
+            city_summary = city_columns.summary(selected_city)
 
             # City metrics
             col1, col2, col3, col4 = st.columns(4)
             with col1:
-                st.metric("Average AQI", f"{city_data['Overall AQI Value'].mean():.1f}")
+                st.metric("Average AQI", f"{city_summary['average_aqi']:.1f}")
             with col2:
-                st.metric("Best AQI", f"{city_data['Overall AQI Value'].min():.1f}")
+                st.metric("Best AQI", f"{city_summary['best_aqi']:.1f}")
             with col3:
-                st.metric("Worst AQI", f"{city_data['Overall AQI Value'].max():.1f}")
+                st.metric("Worst AQI", f"{city_summary['worst_aqi']:.1f}")
             with col4:
-                st.metric("Records", f"{len(city_data):,}")
+                st.metric("Records", f"{city_summary['records']:,}")
+
+            # Trend, monthly and pollutant figures are cached per city and data version
+            city_figures = aqi_figures.city_views(figure_cache, city_summary, selected_city, history_version)
 
             # Time series for selected city
-            fig = px.line(city_data.sort_values('Date'), x='Date', y='Overall AQI Value',
-                         title=f'AQI Trend in {selected_city}')
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(city_figures['trend'], use_container_width=True)
 
             # Monthly patterns
-            city_data['Month-Year'] = city_data['Date'].dt.strftime('%b %Y')
-            monthly_avg = city_data.groupby('Month-Year')['Overall AQI Value'].mean().reset_index()
-
-            fig2 = px.bar(monthly_avg, x='Month-Year', y='Overall AQI Value',
-                         title=f'Monthly Average AQI in {selected_city}')
-            st.plotly_chart(fig2, use_container_width=True)
+            st.plotly_chart(city_figures['monthly'], use_container_width=True)
 
             # Pollutant analysis for the city
             st.subheader("📊 Pollutant Analysis")
-            pollutant_cols = ['CO', 'Ozone', 'PM10', 'PM25', 'NO2']
+            st.plotly_chart(city_figures['pollutants'], use_container_width=True)
+
+# =========================
+# AQI MAP PAGE
+# =========================
+elif selected == "AQI Map":
+    st.title("🗺️ Interpolated AQI Map")
+
+    history_manifest, history_version, csv_version = data_versions()
+    spatial = get_spatial_engine(history_version, csv_version, history_manifest)
+
+    if spatial is None:
+        st.error("Map not available. Historical data and site_locations.json are required.")
+    else:
+        engine, site_registry = spatial
+        years = sorted(engine.dates.year.unique())
+        resolution_freq = {'Daily': 'D', 'Weekly': 'W-MON', 'Monthly': 'MS'}
 
-            pollutant_avg = city_data[pollutant_cols].mean().reset_index()
-            pollutant_avg.columns = ['Pollutant', 'Average']
+        col1, col2 = st.columns(2)
+        with col1:
+            map_year = st.selectbox("Year:", years, index=len(years) - 1, key="map_year")
+        with col2:
+            map_resolution = st.radio("Resolution:", list(resolution_freq), index=2, horizontal=True,
+                                      key="map_resolution")
+
+        periods, grids = engine.grids_for_range(f"{map_year}-01-01", f"{map_year}-12-31",
+                                                resolution_freq[map_resolution])
 
-            fig3 = px.bar(pollutant_avg, x='Pollutant', y='Average',
-                         title=f'Average Pollutant Levels in {selected_city}')
-            st.plotly_chart(fig3, use_container_width=True)
+        if len(periods) == 0:
+            st.warning("No readings for the selected year.")
+        else:
+            animate = st.checkbox("Animate through the year", key="map_animate",
+                                  disabled=map_resolution == 'Daily')
+            if animate and map_resolution != 'Daily':
+                fig = aqi_spatial.animated_heatmap_figure(periods, grids, engine.grid, site_registry,
+                                                          f"{map_resolution} AQI, {map_year}")
+            else:
+                period_labels = [p.strftime('%Y-%m-%d') for p in periods]
+                map_period = st.select_slider("Period starting:", options=period_labels, key=f"map_period_{map_year}_{map_resolution}")
+                fig = aqi_spatial.heatmap_figure(grids[period_labels.index(map_period)], engine.grid,
+                                                 site_registry, f"{map_resolution} AQI from {map_period}")
+            st.plotly_chart(fig, use_container_width=True)
+            st.caption("Inverse distance weighted interpolation between monitoring sites; "
+                       "sites without a reading in a period are left out of that period.")
 
 # =========================
 # ABOUT PAGE
@@ -0,0 +1,33 @@
+# =========================
+# AQI CATEGORIES
+# =========================
+# The six AQI bands shown on the prediction page. Each entry is
+# (upper bound, category, color, icon, advice); the last band is open-ended.
+import numpy as np
+
+AQI_CATEGORIES = [
+    (50, "Good", "#00E400", "😊", "Air quality is satisfactory"),
+    (100, "Moderate", "#FFFF00", "😐", "Acceptable air quality"),
+    (150, "Unhealthy for Sensitive Groups", "#FF7E00", "😷", "Sensitive groups should take caution"),
+    (200, "Unhealthy", "#FF0000", "😟", "Everyone may be affected"),
+    (300, "Very Unhealthy", "#8F3F97", "🚨", "Health alert"),
+    (float('inf'), "Hazardous", "#7E0023", "⚠️", "Emergency conditions"),
+]
+
+CATEGORY_NAMES = [c[1] for c in AQI_CATEGORIES]
+
+# Upper bounds of every band except the open-ended last one
+CATEGORY_BOUNDARIES = np.array([c[0] for c in AQI_CATEGORIES[:-1]], dtype=np.float64)
+
+
+def categorize(aqi_value):
+    """Return (category, color, icon, advice) for a single AQI value."""
+    for upper, category, color, icon, advice in AQI_CATEGORIES:
+        if aqi_value <= upper:
+            return category, color, icon, advice
+    return AQI_CATEGORIES[-1][1:]
+
+
+def category_index(aqi_values):
+    """Vectorized band index (0 = Good ... 5 = Hazardous) for an array of AQI values."""
+    return np.searchsorted(CATEGORY_BOUNDARIES, np.asarray(aqi_values, dtype=np.float64), side='left')
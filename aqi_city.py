@@ -0,0 +1,96 @@
+# =========================
+# CITY ANALYTICS CORE
+# =========================
+# Columnar layout for the City Analysis page. Rows are sorted once by
+# (city, date) into contiguous NumPy blocks, and cities are integer codes
+# with an offsets table. Selecting a city is a dict lookup plus a slice, so
+# it costs the same however many other cities are loaded. No string column
+# is scanned.
+#
+# AQI and the pollutants share one (rows, 6) float block, so a city's
+# summary metrics, pollutant averages and monthly AQI averages come from one
+# pass over its slice. Months are contiguous runs within the date-sorted
+# slice and reduce with np.add.reduceat.
+#
+# The blocks are built from the partitioned history store when one exists
+# (reading only the AQI and pollutant columns) and from the visualization
+# CSV otherwise.
+import numpy as np
+import pandas as pd
+
+import aqi_store
+
+SITE_COL = 'Site Name (of Overall AQI)'
+DATE_COL = 'Date'
+AQI_COL = 'Overall AQI Value'
+POLLUTANTS = ['CO', 'Ozone', 'PM10', 'PM25', 'NO2']
+
+
+class CityColumns:
+    """Readings laid out as contiguous per-city column blocks."""
+
+    def __init__(self, data):
+        codes, cities = pd.factorize(data[SITE_COL].astype(str), sort=True)
+        dates = pd.to_datetime(data[DATE_COL], errors='coerce').to_numpy(dtype='datetime64[ns]')
+        # NaT sorts first within its city, like a missing date would in sort_values
+        order = np.lexsort((dates.view(np.int64), codes))
+
+        self.cities = list(cities)
+        self.city_codes = {name: i for i, name in enumerate(self.cities)}
+        self.offsets = np.searchsorted(codes[order], np.arange(len(self.cities) + 1), side='left')
+        self.dates = dates[order]
+        self.values = np.ascontiguousarray(
+            data[[AQI_COL] + POLLUTANTS].to_numpy(dtype=np.float64)[order])
+
+        # Months since 1970; NaT stays NaT
+        self.months = self.dates.astype('datetime64[M]')
+
+    @classmethod
+    def from_store(cls, manifest, root=aqi_store.STORE_DIR):
+        """Build the blocks from every partition listed in a store manifest."""
+        frames = aqi_store.iter_history([AQI_COL] + POLLUTANTS, root=root, manifest=manifest)
+        return cls(pd.concat(list(frames), ignore_index=True))
+
+    def city_slice(self, city):
+        code = self.city_codes[city]
+        return slice(self.offsets[code], self.offsets[code + 1])
+
+    def summary(self, city):
+        """
+        Everything the City Analysis page shows for one city: AQI mean, min,
+        max and record count, the AQI trend, monthly AQI averages in
+        calendar order and pollutant averages.
+        """
+        rows = self.city_slice(city)
+        block = self.values[rows]
+        valid = ~np.isnan(block)
+        filled = np.where(valid, block, 0.0)
+        sums = filled.sum(axis=0)
+        counts = valid.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = sums / counts
+
+        aqi = block[:, 0]
+        aqi_valid = valid[:, 0]
+        months = self.months[rows]
+        # Undated rows sort first and are left out of the monthly averages
+        first = int(np.isnat(months).sum())
+        month_starts, monthly_avg = months[:0], np.empty(0)
+        if first < len(months):
+            keys = months[first:].view(np.int64)
+            starts = np.concatenate([[0], np.flatnonzero(np.diff(keys)) + 1])
+            month_sums = np.add.reduceat(filled[first:, 0], starts)
+            month_counts = np.add.reduceat(aqi_valid[first:].astype(np.int64), starts)
+            kept = month_counts > 0
+            month_starts = months[first:][starts][kept]
+            monthly_avg = month_sums[kept] / month_counts[kept]
+        labels = pd.DatetimeIndex(month_starts.astype('datetime64[ns]')).strftime('%b %Y')
+        return {
+            'records': int(len(block)),
+            'average_aqi': float(means[0]),
+            'best_aqi': float(aqi[aqi_valid].min()) if aqi_valid.any() else float('nan'),
+            'worst_aqi': float(aqi[aqi_valid].max()) if aqi_valid.any() else float('nan'),
+            'trend': pd.DataFrame({DATE_COL: self.dates[rows], AQI_COL: aqi}),
+            'monthly': pd.DataFrame({'Month-Year': np.asarray(labels), AQI_COL: monthly_avg}),
+            'pollutants': pd.DataFrame({'Pollutant': POLLUTANTS, 'Average': means[1:]}),
+        }
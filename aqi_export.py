@@ -0,0 +1,242 @@
+# =========================
+# STREAMING EXPORT
+# =========================
+# Exports the filtered history (date range, cities, columns), optionally with
+# model predictions and intervals attached, as CSV, NDJSON or Parquet. Data
+# flows through as one chunk per store partition (or per CSV block when no
+# store has been built) and is encoded and compressed incrementally, so the
+# full result never exists in memory at once. An empty result still carries
+# its columns (CSV header, Parquet schema).
+#
+# The dashboard has to hand Streamlit the whole file, so in-app exports are
+# capped at MAX_IN_MEMORY_BYTES; larger ones go through this CLI or the
+# prediction server's GET /export, which stream.
+#
+#     python aqi_export.py --start 2021-01-01 --end 2021-12-31 --cities Delhi \
+#         --columns PM10 PM25 --format parquet --compression zstd --predict -o delhi_2021.parquet
+import io
+import sys
+import zlib
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import aqi_store
+import aqi_categories
+
+FORMATS = {'csv': '.csv', 'ndjson': '.ndjson', 'parquet': '.parquet'}
+COMPRESSIONS = ('none', 'gzip', 'zstd')
+MIME_TYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson', 'parquet': 'application/vnd.apache.parquet'}
+CSV_PATH = "aqi_visualization_data.csv"
+CSV_CHUNK_ROWS = 100_000
+MAX_IN_MEMORY_BYTES = 64 * 1024 * 1024
+SITE_COL = aqi_store.SITE_COL
+DATE_COL = aqi_store.DATE_COL
+
+
+def export_filename(base, fmt, compression):
+    name = base + FORMATS[fmt]
+    # Parquet compresses internally; text formats get a file suffix
+    if fmt != 'parquet' and compression == 'gzip':
+        name += '.gz'
+    elif fmt != 'parquet' and compression == 'zstd':
+        name += '.zst'
+    return name
+
+
+# =========================
+# SOURCES
+# =========================
+def _empty_chunk(names):
+    # Typed like real chunks so the header / Parquet schema matches a non-empty export
+    return pd.DataFrame({name: pd.Series(dtype='datetime64[ns]' if name == DATE_COL
+                                         else str if name == SITE_COL else np.float64)
+                         for name in names})
+
+
+def iter_chunks(columns, start=None, end=None, cities=None, root=aqi_store.STORE_DIR, csv_path=CSV_PATH):
+    """
+    Yield filtered history in chunks, from the partitioned store if one exists.
+    A filter that matches nothing yields one empty chunk with the columns.
+    """
+    values = [c for c in dict.fromkeys(columns) if c not in (DATE_COL, SITE_COL)]
+    manifest = aqi_store.load_manifest(root)
+    if manifest is not None:
+        empty = True
+        for chunk in aqi_store.iter_history(columns, start, end, cities, root, manifest):
+            empty = False
+            yield chunk
+        if empty:
+            yield _empty_chunk([DATE_COL] + values + [SITE_COL])
+        return
+
+    wanted = [DATE_COL, SITE_COL] + values
+    empty = True
+    for chunk in pd.read_csv(csv_path, parse_dates=[DATE_COL], usecols=wanted, chunksize=CSV_CHUNK_ROWS):
+        if start is not None:
+            chunk = chunk[chunk[DATE_COL] >= pd.Timestamp(start)]
+        if end is not None:
+            chunk = chunk[chunk[DATE_COL] < pd.Timestamp(end) + pd.Timedelta(days=1)]
+        if cities:
+            chunk = chunk[chunk[SITE_COL].isin(cities)]
+        if len(chunk):
+            empty = False
+            yield chunk[wanted]
+    if empty:
+        yield _empty_chunk(wanted)
+
+
+def with_predictions(chunks, forest, features):
+    """Attach predicted AQI, its 5-95% interval and category exceedance probabilities."""
+    for chunk in chunks:
+        X = chunk[features].to_numpy(dtype=np.float64)
+        complete = ~np.isnan(X).any(axis=1)
+        chunk = chunk.copy()
+        columns = {name: np.full(len(chunk), np.nan) for name in
+                   ['Predicted AQI', 'Predicted AQI Std', 'Predicted AQI Lower', 'Predicted AQI Upper']
+                   + [f"P({name} or worse)" for name in aqi_categories.CATEGORY_NAMES[1:]]}
+        if complete.any():
+            distribution = forest.predict_distribution(X[complete], thresholds=aqi_categories.CATEGORY_BOUNDARIES)
+            lower_q, upper_q = sorted(distribution['quantiles'])
+            columns['Predicted AQI'][complete] = distribution['mean']
+            columns['Predicted AQI Std'][complete] = distribution['std']
+            columns['Predicted AQI Lower'][complete] = distribution['quantiles'][lower_q]
+            columns['Predicted AQI Upper'][complete] = distribution['quantiles'][upper_q]
+            for j, name in enumerate(aqi_categories.CATEGORY_NAMES[1:]):
+                columns[f"P({name} or worse)"][complete] = distribution['exceedance'][:, j]
+        for name, values in columns.items():
+            chunk[name] = values
+        yield chunk
+
+
+# =========================
+# ENCODERS
+# =========================
+class _ByteSink(io.RawIOBase):
+    # File-like target for the Parquet writer; collected bytes are drained after each row group
+    def __init__(self):
+        self.parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data, self.parts = b"".join(self.parts), []
+        return data
+
+
+def _encode_parquet(chunks, compression):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink, writer, schema = _ByteSink(), None, None
+    codec = 'NONE' if compression == 'none' else compression
+    for chunk in chunks:
+        if writer is None:
+            schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+            writer = pq.ParquetWriter(sink, schema, compression=codec)
+        writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+        yield sink.drain()
+    if writer is None:
+        # No chunks at all: still write a valid (schema-only) file
+        writer = pq.ParquetWriter(sink, pa.schema([]), compression=codec)
+    writer.close()
+    yield sink.drain()
+
+
+def _encode_text(chunks, fmt):
+    for i, chunk in enumerate(chunks):
+        if fmt == 'csv':
+            yield chunk.to_csv(index=False, header=(i == 0)).encode('utf-8')
+        elif len(chunk):
+            yield chunk.to_json(orient='records', lines=True, date_format='iso').encode('utf-8')
+
+
+def _compressor(compression):
+    if compression == 'gzip':
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstd compression for text formats requires the 'zstandard' package")
+        return zstandard.ZstdCompressor().compressobj()
+    return None
+
+
+def encode_chunks(chunks, fmt='csv', compression='none'):
+    """Yield the encoded (and compressed) export as a stream of byte blocks."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression: {compression}")
+
+    if fmt == 'parquet':
+        yield from _encode_parquet(chunks, compression)
+        return
+
+    compressor = _compressor(compression)
+    for block in _encode_text(chunks, fmt):
+        block = compressor.compress(block) if compressor else block
+        if block:
+            yield block
+    if compressor:
+        yield compressor.flush()
+
+
+def write_export(fileobj, chunks, fmt='csv', compression='none'):
+    """Stream an export into a binary file object; returns the number of bytes written."""
+    written = 0
+    for block in encode_chunks(chunks, fmt, compression):
+        fileobj.write(block)
+        written += len(block)
+    return written
+
+
+def export_bytes(chunks, fmt='csv', compression='none', max_bytes=MAX_IN_MEMORY_BYTES):
+    """The whole encoded export as bytes; raises ValueError once it grows past `max_bytes`."""
+    buffer = io.BytesIO()
+    for block in encode_chunks(chunks, fmt, compression):
+        if buffer.tell() + len(block) > max_bytes:
+            raise ValueError(f"export is larger than {max_bytes // (1024 * 1024)} MB; use aqi_export.py "
+                             "or the prediction server's /export endpoint, which stream")
+        buffer.write(block)
+    return buffer.getvalue()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export filtered AQI history in a streaming format")
+    parser.add_argument("--start")
+    parser.add_argument("--end")
+    parser.add_argument("--cities", nargs="*", default=[])
+    parser.add_argument("--columns", nargs="*", default=['Overall AQI Value'])
+    parser.add_argument("--format", choices=list(FORMATS), default='csv')
+    parser.add_argument("--compression", choices=COMPRESSIONS, default='none')
+    parser.add_argument("--predict", action="store_true", help="attach model predictions and intervals")
+    parser.add_argument("--model", default="air_pollution_model.pkl")
+    parser.add_argument("-o", "--output", default="-", help="output file ('-' for stdout)")
+    args = parser.parse_args()
+
+    columns = list(args.columns)
+    if args.predict:
+        import pickle
+        from aqi_forest import ForestArrays
+        with open(args.model, "rb") as f:
+            forest = ForestArrays.from_model(pickle.load(f))
+        columns += [c for c in forest.feature_names if c not in columns]
+        chunk_source = with_predictions(iter_chunks(columns, args.start, args.end, args.cities),
+                                        forest, forest.feature_names)
+    else:
+        chunk_source = iter_chunks(columns, args.start, args.end, args.cities)
+
+    if args.output == "-":
+        total = write_export(sys.stdout.buffer, chunk_source, args.format, args.compression)
+    else:
+        with open(args.output, "wb") as out:
+            total = write_export(out, chunk_source, args.format, args.compression)
+    print(f"Exported {total:,} bytes", file=sys.stderr)
@@ -0,0 +1,270 @@
+# =========================
+# FIGURE CACHE
+# =========================
+# Plotly figures for the Historical Data and City Analysis pages, built
+# once per view and kept as serialized figure JSON. A view is keyed by
+# (page, figure, city set, date range, pollutant, options, data version), so
+# a rebuilt store or a new CSV simply misses and is rebuilt.
+#
+# The cache lives in the server process and is shared by all sessions. A
+# background job fills it with the common views (full range for each single
+# city, and for all cities when the data is a CSV already in memory) when the
+# data version changes, so opening those views renders without touching the
+# data. From the store the job reads one city at a time. Callers key views
+# on the version of the same manifest / CSV snapshot their data came from,
+# so figures are never stored under a newer version than the data they show.
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+import aqi_city
+import aqi_store
+import aqi_resample
+
+CSV_PATH = "aqi_visualization_data.csv"
+SITE_COL = 'Site Name (of Overall AQI)'
+DATE_COL = 'Date'
+AQI_COL = 'Overall AQI Value'
+POLLUTANTS = ['CO', 'Ozone', 'PM10', 'PM25', 'NO2']
+MAX_CACHE_BYTES = 128 * 1024 * 1024
+HISTOGRAM_BINS = 50
+
+
+# =========================
+# FIGURE BUILDERS
+# =========================
+def history_trend_figure(trend_data, pollutant):
+    return px.line(trend_data.sort_values(DATE_COL), x=DATE_COL, y=pollutant,
+                   color=SITE_COL if SITE_COL in trend_data.columns else None,
+                   title=f'{pollutant} Over Time')
+
+
+def history_comparison_figure(city_stats, pollutant):
+    return px.bar(city_stats.reset_index(), x=SITE_COL, y='mean',
+                  title=f'Average {pollutant} by City')
+
+
+def history_city_aqi_figure(city_avg):
+    fig = px.bar(city_avg, x=SITE_COL, y=AQI_COL,
+                 title='Average AQI by City',
+                 color=SITE_COL,
+                 text=AQI_COL,
+                 color_discrete_sequence=px.colors.qualitative.Set2)
+    fig.update_traces(texttemplate='%{text:.1f}', textposition='outside')
+    fig.update_layout(xaxis_title="City", yaxis_title="Average AQI")
+    return fig
+
+
+def history_distribution_figure(data, pollutant):
+    # Binned here so the serialized figure holds HISTOGRAM_BINS bars rather than every reading
+    counts, edges = np.histogram(data[pollutant].dropna().to_numpy(dtype=np.float64), bins=HISTOGRAM_BINS)
+    fig = px.bar(x=(edges[:-1] + edges[1:]) / 2, y=counts, title='Distribution',
+                 labels={'x': pollutant, 'y': 'count'})
+    fig.update_traces(width=np.diff(edges))
+    fig.update_layout(bargap=0)
+    return fig
+
+
+def city_trend_figure(trend, city):
+    # aqi_city summaries are already in date order
+    return px.line(trend, x=DATE_COL, y=AQI_COL,
+                   title=f'AQI Trend in {city}')
+
+
+def city_monthly_figure(monthly_avg, city):
+    return px.bar(monthly_avg, x='Month-Year', y=AQI_COL,
+                  title=f'Monthly Average AQI in {city}')
+
+
+def city_pollutant_figure(pollutant_avg, city):
+    return px.bar(pollutant_avg, x='Pollutant', y='Average',
+                  title=f'Average Pollutant Levels in {city}')
+
+
+# =========================
+# CACHE
+# =========================
+def file_version(path):
+    """Version stamp of a data file (modification time and size)."""
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def figure_key(page, figure, cities=(), date_range=(None, None), pollutant=None, data_version=None, **options):
+    """Cache key for one view; city order and date types don't matter."""
+    parts = [page, figure, sorted(str(c) for c in cities or ()),
+             [str(d) if d is not None else None for d in date_range], pollutant, data_version,
+             sorted(options.items())]
+    return hashlib.sha1(json.dumps(parts, default=str).encode('utf-8')).hexdigest()
+
+
+class FigureCache:
+    """Thread-safe LRU of serialized figure JSON, bounded by total size."""
+
+    def __init__(self, max_bytes=MAX_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._specs = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._specs
+
+    def get(self, key):
+        """The cached figure as a plain dict (ready for st.plotly_chart), or None."""
+        with self._lock:
+            spec = self._specs.get(key)
+            if spec is None:
+                self.misses += 1
+                return None
+            self._specs.move_to_end(key)
+            self.hits += 1
+        return json.loads(spec)
+
+    def put(self, key, fig):
+        spec = fig.to_json()
+        with self._lock:
+            if key in self._specs:
+                self._bytes -= len(self._specs.pop(key))
+            self._specs[key] = spec
+            self._bytes += len(spec)
+            while self._bytes > self.max_bytes and len(self._specs) > 1:
+                _, evicted = self._specs.popitem(last=False)
+                self._bytes -= len(evicted)
+        return json.loads(spec)
+
+    def get_or_build(self, key, build):
+        """Cached figure for `key`, calling `build()` for a go.Figure on a miss."""
+        cached = self.get(key)
+        return cached if cached is not None else self.put(key, build())
+
+    def stats(self):
+        with self._lock:
+            return {'figures': len(self._specs), 'bytes': self._bytes, 'hits': self.hits, 'misses': self.misses}
+
+
+# =========================
+# PRECOMPUTE
+# =========================
+HISTORY_FIGURES = ('trend', 'comparison', 'city_aqi', 'distribution')
+
+
+def history_figure(cache, figure, data, start, end, cities, pollutant, data_version, aggregation='mean'):
+    """
+    One Historical Data figure for a filter selection, from the cache if
+    possible. The trend figure records its resolution in layout.meta.
+    """
+    def trend():
+        trend_data, resolution = aqi_resample.resample_for_view(data, [pollutant], start, end, how=aggregation)
+        fig = history_trend_figure(trend_data, pollutant)
+        fig.update_layout(meta={'resolution': resolution})
+        return fig
+
+    def comparison():
+        stats = data.groupby(SITE_COL, observed=True)[pollutant].agg(['mean', 'min', 'max']).round(2)
+        return history_comparison_figure(stats, pollutant)
+
+    def city_aqi():
+        return history_city_aqi_figure(data.groupby(SITE_COL, observed=True)[AQI_COL].mean().reset_index())
+
+    builders = {
+        'trend': trend,
+        'comparison': comparison,
+        'city_aqi': city_aqi,
+        'distribution': lambda: history_distribution_figure(data, pollutant),
+    }
+    options = {'aggregation': aggregation} if figure == 'trend' else {}
+    key = figure_key('history', figure, cities, (start, end), pollutant, data_version, **options)
+    return cache.get_or_build(key, builders[figure])
+
+
+def history_views(cache, data, start, end, cities, pollutant, data_version, aggregation='mean'):
+    """All Historical Data figures for one filter selection."""
+    return {figure: history_figure(cache, figure, data, start, end, cities, pollutant, data_version, aggregation)
+            for figure in HISTORY_FIGURES}
+
+
+def city_views(cache, summary, city, data_version):
+    """Build (or fetch) the three City Analysis figures from an aqi_city summary."""
+    def key(figure):
+        return figure_key('city', figure, [city], data_version=data_version)
+
+    return {
+        'trend': cache.get_or_build(key('trend'), lambda: city_trend_figure(summary['trend'], city)),
+        'monthly': cache.get_or_build(key('monthly'), lambda: city_monthly_figure(summary['monthly'], city)),
+        'pollutants': cache.get_or_build(key('pollutants'),
+                                         lambda: city_pollutant_figure(summary['pollutants'], city)),
+    }
+
+
+def precompute_common_views(cache, stop_event=None, root=aqi_store.STORE_DIR, csv_path=CSV_PATH):
+    """
+    Fill the cache with the default views: every city on its own at full
+    range on the Historical Data page (plus all cities together when reading
+    the CSV), and every city on the City Analysis page. Returns the number
+    of views built.
+    """
+    built = 0
+
+    # Both pages read one snapshot: the store manifest, or the visualization CSV when there is
+    # no store. The CSV's version is taken before reading, so a file replaced meanwhile can only
+    # put newer figures under the older key, never the reverse.
+    manifest = aqi_store.load_manifest(root)
+    summary = aqi_store.store_summary(manifest) if manifest is not None else None
+    if summary is not None:
+        version = manifest['version']
+        city_columns = aqi_city.CityColumns.from_store(manifest, root)
+    elif os.path.exists(csv_path):
+        version = file_version(csv_path)
+        viz_data = pd.read_csv(csv_path, parse_dates=[DATE_COL])
+        city_columns = aqi_city.CityColumns(viz_data)
+    else:
+        return built
+
+    # City Analysis
+    for city in city_columns.cities:
+        if stop_event is not None and stop_event.is_set():
+            return built
+        city_views(cache, city_columns.summary(city), city, version)
+        built += 1
+
+    # Historical Data: full date range, default aggregation, every pollutant. The store is read
+    # one city at a time; its all-cities view is built when someone asks for it.
+    if summary is not None:
+        start, end, cities = summary
+        city_sets = [[city] for city in cities]
+    else:
+        history = viz_data[viz_data[DATE_COL].notna()]
+        start, end = history[DATE_COL].min().date(), history[DATE_COL].max().date()
+        cities = sorted(history[SITE_COL].unique())
+        city_sets = [[]] + [[city] for city in cities]
+    for city_set in city_sets:
+        if summary is not None:
+            data = pd.concat(list(aqi_store.iter_history(POLLUTANTS + [AQI_COL], start, end, city_set,
+                                                         root, manifest)), ignore_index=True)
+        else:
+            data = history[history[SITE_COL].isin(city_set)] if city_set else history
+        for pollutant in POLLUTANTS + [AQI_COL]:
+            if stop_event is not None and stop_event.is_set():
+                return built
+            columns = list(dict.fromkeys([DATE_COL, SITE_COL, pollutant, AQI_COL]))
+            history_views(cache, data[columns], start, end, city_set, pollutant, version)
+            built += 1
+    return built
+
+
+def start_precompute(cache, **kwargs):
+    """Run precompute_common_views in a daemon thread; returns (thread, stop_event)."""
+    stop_event = threading.Event()
+    thread = threading.Thread(target=precompute_common_views, args=(cache, stop_event), kwargs=kwargs,
+                              name="figure-precompute", daemon=True)
+    thread.start()
+    return thread, stop_event
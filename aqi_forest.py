@@ -0,0 +1,231 @@
+# =========================
+# FLAT ARRAY FOREST
+# =========================
+# The Random Forest in air_pollution_model.pkl is flattened into a handful of
+# contiguous NumPy arrays (all trees' nodes concatenated). Prediction walks
+# every tree for every row at once, one tree level per step, so a batch costs
+# `max_depth` vectorized gathers instead of a Python loop over estimators.
+#
+# The arrays can be packed into a single shared memory block so several
+# processes evaluate the same forest without each holding a private copy.
+import json
+import sys
+from multiprocessing import shared_memory
+
+import numpy as np
+
+ARRAY_FIELDS = ('children', 'feature', 'threshold', 'value', 'roots')
+HEADER_BYTES = 8
+ALIGNMENT = 64
+# Rows evaluated together; keeps the (rows, trees) working set cache-sized
+ROW_CHUNK = 512
+DEFAULT_QUANTILES = (0.05, 0.95)
+
+
+class ForestArrays:
+    """Node arrays for a fitted single-output tree ensemble."""
+
+    def __init__(self, children, feature, threshold, value, roots,
+                 max_depth, feature_names=None, version=None):
+        # children[node] = (left, right); interleaved so one gather picks the branch
+        self.children = children
+        self.feature = feature
+        self.threshold = threshold
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.feature_names = list(feature_names) if feature_names is not None else None
+        self.version = version
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @classmethod
+    def from_model(cls, model, version=None):
+        """Flatten a fitted RandomForestRegressor (or any list of regression trees)."""
+        children, features, thresholds, values, roots = [], [], [], [], []
+        offset = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            nodes = np.arange(tree.node_count, dtype=np.int32) + offset
+            is_leaf = tree.children_left == -1
+
+            # Leaves point at themselves so extra descent steps are no-ops
+            children.append(np.stack([
+                np.where(is_leaf, nodes, tree.children_left + offset),
+                np.where(is_leaf, nodes, tree.children_right + offset),
+            ], axis=1).astype(np.int32))
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            values.append(tree.value[:, 0, 0])
+            roots.append(offset)
+            offset += tree.node_count
+
+        feature_names = getattr(model, 'feature_names_in_', None)
+        return cls(
+            np.concatenate(children), np.concatenate(features),
+            np.concatenate(thresholds), np.concatenate(values).astype(np.float64),
+            np.asarray(roots, dtype=np.int32),
+            max(e.tree_.max_depth for e in model.estimators_),
+            feature_names=feature_names, version=version,
+        )
+
+    # -------------------------
+    # Evaluation
+    # -------------------------
+    def _as_features(self, X):
+        # Match scikit-learn, which compares float32 features against its thresholds
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        return X.reshape(1, -1) if X.ndim == 1 else X
+
+    def apply(self, X):
+        """Global leaf index reached in every tree, shape (n_rows, n_trees)."""
+        X = self._as_features(X)
+        n_rows, n_features = X.shape
+        children = self.children.ravel()
+        leaves = np.empty((n_rows, self.n_trees), dtype=np.int32)
+
+        for start in range(0, n_rows, ROW_CHUNK):
+            chunk = X[start:start + ROW_CHUNK]
+            flat_x = chunk.ravel()
+            row_base = (np.arange(len(chunk)) * n_features)[:, None]
+            nodes = np.broadcast_to(self.roots, (len(chunk), self.n_trees)).copy()
+            for _ in range(self.max_depth):
+                go_right = flat_x[row_base + self.feature[nodes]] > self.threshold[nodes]
+                nodes = children[nodes * 2 + go_right]
+            leaves[start:start + ROW_CHUNK] = nodes
+        return leaves
+
+    def predict_per_tree(self, X):
+        """Prediction of every tree, shape (n_rows, n_trees)."""
+        return self.value[self.apply(X)]
+
+    def predict(self, X):
+        return self.predict_per_tree(X).mean(axis=1)
+
+    def predict_distribution(self, X, quantiles=DEFAULT_QUANTILES, thresholds=()):
+        """
+        Summaries of the per-tree predictions from a single forest evaluation.
+
+        Returns a dict with 'mean' and 'std' (n_rows,), 'quantiles' mapping
+        each requested quantile to an (n_rows,) array, and 'exceedance', the
+        share of trees predicting above each threshold (n_rows, n_thresholds).
+        The spread reflects disagreement between trees, not measurement noise.
+        """
+        per_tree = self.predict_per_tree(X)
+        result = {'mean': per_tree.mean(axis=1), 'std': per_tree.std(axis=1)}
+        if quantiles:
+            values = np.quantile(per_tree, quantiles, axis=1)
+            result['quantiles'] = {q: values[i] for i, q in enumerate(quantiles)}
+        thresholds = np.asarray(thresholds, dtype=np.float64)
+        result['exceedance'] = (per_tree[:, :, None] > thresholds).mean(axis=1)
+        return result
+
+    # -------------------------
+    # Shared memory
+    # -------------------------
+    def to_shared_memory(self, name=None):
+        """
+        Copy the forest into a new shared memory block and return it.
+
+        The block holds a JSON header describing the array layout followed by
+        the arrays themselves, so `from_shared_memory(block.name)` is enough to
+        reconstruct the forest in another process.
+        """
+        layout, offset = {}, 0
+        for field in ARRAY_FIELDS:
+            array = getattr(self, field)
+            layout[field] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+            offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+
+        header = json.dumps({
+            'layout': layout, 'max_depth': self.max_depth,
+            'feature_names': self.feature_names, 'version': self.version,
+        }).encode('utf-8')
+        data_start = -(-(HEADER_BYTES + len(header)) // ALIGNMENT) * ALIGNMENT
+
+        block = shared_memory.SharedMemory(name=name, create=True, size=data_start + offset)
+        block.buf[:HEADER_BYTES] = len(header).to_bytes(HEADER_BYTES, 'little')
+        block.buf[HEADER_BYTES:HEADER_BYTES + len(header)] = header
+        for field in ARRAY_FIELDS:
+            spec = layout[field]
+            target = np.ndarray(spec['shape'], dtype=spec['dtype'], buffer=block.buf,
+                                offset=data_start + spec['offset'])
+            target[...] = getattr(self, field)
+        return block
+
+    @classmethod
+    def from_shared_memory(cls, name):
+        """
+        Attach to a block written by `to_shared_memory`.
+
+        Returns (forest, block); the arrays are read-only views into the block,
+        so keep `block` referenced for as long as the forest is used.
+        """
+        if sys.version_info >= (3, 13):
+            block = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            block = shared_memory.SharedMemory(name=name)
+
+        header_len = int.from_bytes(bytes(block.buf[:HEADER_BYTES]), 'little')
+        header = json.loads(bytes(block.buf[HEADER_BYTES:HEADER_BYTES + header_len]).decode('utf-8'))
+        data_start = -(-(HEADER_BYTES + header_len) // ALIGNMENT) * ALIGNMENT
+
+        arrays = {}
+        for field, spec in header['layout'].items():
+            view = np.ndarray(spec['shape'], dtype=spec['dtype'], buffer=block.buf,
+                              offset=data_start + spec['offset'])
+            view.flags.writeable = False
+            arrays[field] = view
+
+        forest = cls(max_depth=header['max_depth'], feature_names=header['feature_names'],
+                     version=header['version'], **arrays)
+        return forest, block
+
+
+# =========================
+# PATH ATTRIBUTION
+# =========================
+class PathExplainer:
+    """
+    Per-prediction feature contributions (Saabas path attribution).
+
+    Walking from a tree's root to a leaf, every split moves the node value by
+    value[child] - value[parent]; that change is credited to the split's
+    feature. The running total is precomputed for every node once, so a
+    row's contributions are just the totals at the leaves it reaches,
+    averaged over trees. For every row, bias + contributions.sum() equals
+    the forest prediction.
+    """
+
+    def __init__(self, forest, n_features=None):
+        self.forest = forest
+        if n_features is None:
+            n_features = len(forest.feature_names) if forest.feature_names else int(forest.feature.max()) + 1
+        self.n_features = n_features
+
+        children, feature, value = forest.children, forest.feature, forest.value
+        contributions = np.zeros((len(value), n_features))
+        frontier = np.asarray(forest.roots, dtype=np.int64)
+        # Fill one tree level at a time; each child inherits its parent's total
+        while len(frontier):
+            parents = frontier[children[frontier, 0] != frontier]
+            split_feature = feature[parents]
+            for side in (0, 1):
+                kids = children[parents, side]
+                contributions[kids] = contributions[parents]
+                contributions[kids, split_feature] += value[kids] - value[parents]
+            frontier = children[parents].ravel()
+
+        self.node_contributions = contributions
+        self.bias = float(value[forest.roots].mean())
+
+    def explain(self, X):
+        """Contributions per feature, shape (n_rows, n_features)."""
+        X = self.forest._as_features(X)
+        result = np.empty((X.shape[0], self.n_features))
+        for start in range(0, X.shape[0], ROW_CHUNK):
+            leaves = self.forest.apply(X[start:start + ROW_CHUNK])
+            result[start:start + ROW_CHUNK] = self.node_contributions[leaves].mean(axis=1)
+        return result
@@ -0,0 +1,248 @@
+# =========================
+# DRIFT & DATA-QUALITY MONITORING
+# =========================
+# Incoming prediction inputs are binned into fixed-size histograms (one per
+# city and pollutant) on the same bin edges as a reference built from the
+# training data. Memory is bounded by cities x pollutants x bins no matter
+# how many readings arrive.
+#
+# Callers only append inputs to a bounded queue; a background thread bins
+# them in batches, so the prediction path pays for one queue put. If binning
+# falls behind, new observations are dropped (and counted) rather than
+# queued. Drift is reported as PSI and a binned Kolmogorov-Smirnov distance
+# against the reference, once a city and pollutant have MIN_READINGS.
+#
+# The dashboard, the prediction server (GET /drift, per worker process) and
+# the alert engine each keep a monitor fed from their own prediction inputs.
+import json
+import time
+import queue
+import threading
+
+import numpy as np
+import pandas as pd
+
+POLLUTANTS = ['CO', 'Ozone', 'PM10', 'PM25', 'NO2']
+SITE_COL = 'Site Name (of Overall AQI)'
+ALL_CITIES = 'All'
+OTHER_CITIES = 'Other'
+N_BINS = 20
+MAX_CITIES = 500
+FLUSH_SECONDS = 0.5
+MAX_PENDING = 10_000
+# PSI and KS on a handful of readings are noise; below this only counts are reported
+MIN_READINGS = 100
+STATS_PATH = 'pollutant_statistics.json'
+TRAINING_DATA_PATH = 'aqi_visualization_data.csv'
+
+# PSI rule of thumb: < 0.1 stable, 0.1-0.25 moderate shift, > 0.25 significant
+PSI_MODERATE = 0.1
+PSI_SIGNIFICANT = 0.25
+_EPSILON = 1e-4
+
+
+def load_training_envelope(stats_path=STATS_PATH):
+    """Per-pollutant (min, max) arrays from the training statistics file."""
+    with open(stats_path, 'r') as f:
+        stats = json.load(f)
+    low = np.array([stats[p]['min'] for p in POLLUTANTS], dtype=np.float64)
+    high = np.array([stats[p]['max'] for p in POLLUTANTS], dtype=np.float64)
+    return low, high
+
+
+def outside_envelope(X, low, high):
+    """Boolean (rows, pollutants) mask of values outside the training min/max."""
+    X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+    return (X < low) | (X > high)
+
+
+class PollutantHistograms:
+    """
+    Counts per (city, pollutant) over `n_bins` equal-width bins spanning the
+    training envelope, plus one underflow and one overflow bin.
+    """
+
+    def __init__(self, low, high, n_bins=N_BINS, max_cities=MAX_CITIES):
+        self.low = np.asarray(low, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.n_bins = n_bins
+        self.max_cities = max_cities
+        self.width = np.where(self.high > self.low, (self.high - self.low) / n_bins, 1.0)
+        self.counts = {}
+
+    def _city_counts(self, city):
+        if city not in self.counts:
+            # Cap the number of tracked cities so memory stays bounded
+            if len(self.counts) >= self.max_cities and city != ALL_CITIES:
+                city = OTHER_CITIES
+            self.counts.setdefault(city, np.zeros((len(self.low), self.n_bins + 2), dtype=np.int64))
+        return self.counts[city]
+
+    def bin_index(self, X):
+        """Bin of every value: 0 is below the envelope, n_bins + 1 above it."""
+        inner = np.floor((X - self.low) / self.width).astype(np.int64)
+        inner = np.clip(inner, 0, self.n_bins - 1) + 1
+        inner = np.where(X < self.low, 0, inner)
+        return np.where(X > self.high, self.n_bins + 1, inner)
+
+    def update(self, X, cities=None):
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        valid = ~np.isnan(X)
+        bins = self.bin_index(np.where(valid, X, self.low))
+        n_slots = self.n_bins + 2
+        # One bincount per city over (pollutant, bin) pairs flattened together
+        flat = bins + np.arange(X.shape[1]) * n_slots
+
+        groups = [(ALL_CITIES, slice(None))]
+        if cities is not None:
+            cities = np.asarray(cities)
+            names, inverse = np.unique(cities, return_inverse=True)
+            groups += [(name, inverse == i) for i, name in enumerate(names)]
+
+        for city, rows in groups:
+            counts = np.bincount(flat[rows][valid[rows]], minlength=X.shape[1] * n_slots)
+            self._city_counts(city)[...] += counts.reshape(X.shape[1], n_slots)
+
+    @classmethod
+    def from_frame(cls, data, low, high, n_bins=N_BINS):
+        histograms = cls(low, high, n_bins)
+        cities = data[SITE_COL].astype(str).to_numpy() if SITE_COL in data.columns else None
+        histograms.update(data[POLLUTANTS].to_numpy(dtype=np.float64), cities)
+        return histograms
+
+
+def default_monitor(stats_path=STATS_PATH, data_path=TRAINING_DATA_PATH):
+    """A DriftMonitor against the training data, or None if the training files are missing."""
+    try:
+        low, high = load_training_envelope(stats_path)
+        training_data = pd.read_csv(data_path)
+    except (OSError, KeyError, ValueError):
+        return None
+    return DriftMonitor(PollutantHistograms.from_frame(training_data, low, high))
+
+
+def population_stability_index(expected, actual):
+    p = np.maximum(expected / max(expected.sum(), 1), _EPSILON)
+    q = np.maximum(actual / max(actual.sum(), 1), _EPSILON)
+    return float(((q - p) * np.log(q / p)).sum())
+
+
+def binned_ks(expected, actual):
+    # KS statistic on binned data: largest gap between the two empirical CDFs at bin edges
+    p = np.cumsum(expected) / max(expected.sum(), 1)
+    q = np.cumsum(actual) / max(actual.sum(), 1)
+    return float(np.abs(p - q).max())
+
+
+class DriftMonitor:
+    """Asynchronously bins observed inputs and compares them with a reference."""
+
+    def __init__(self, reference, flush_seconds=FLUSH_SECONDS, max_pending=MAX_PENDING,
+                 min_readings=MIN_READINGS):
+        self.reference = reference
+        self.current = PollutantHistograms(reference.low, reference.high, reference.n_bins,
+                                           reference.max_cities)
+        self.flush_seconds = flush_seconds
+        self.min_readings = min_readings
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        # Observations discarded because they were malformed or the queue was full
+        self.dropped = 0
+        self.last_error = None
+        self._thread = threading.Thread(target=self._run, name="drift-monitor", daemon=True)
+        self._thread.start()
+
+    def observe(self, X, city=None):
+        """Record prediction inputs (rows in POLLUTANTS order); never blocks on binning."""
+        try:
+            self._pending.put_nowait((X, city))
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self):
+        items = []
+        while True:
+            try:
+                items.append(self._pending.get_nowait())
+            except queue.Empty:
+                break
+        if not items:
+            return
+
+        arrays, cities = [], []
+        for X, city in items:
+            # A malformed observation is dropped on its own instead of failing the batch
+            try:
+                X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+                if X.ndim != 2 or X.shape[1] != len(self.reference.low):
+                    raise ValueError(f"expected {len(self.reference.low)} values per row, got shape {X.shape}")
+                if city is None or isinstance(city, str):
+                    city = np.full(len(X), city if city is not None else ALL_CITIES, dtype=object)
+                else:
+                    city = np.asarray(city, dtype=object).ravel()
+                    if len(city) != len(X):
+                        raise ValueError(f"{len(city)} cities for {len(X)} rows")
+            except (ValueError, TypeError) as e:
+                self.dropped += 1
+                self.last_error = str(e)
+                continue
+            arrays.append(X)
+            cities.append(np.where(pd.isna(city), ALL_CITIES, city))
+        if not arrays:
+            return
+        all_cities = np.concatenate(cities)
+        # Rows without a city only count towards the ALL_CITIES histogram
+        named = all_cities != ALL_CITIES
+        X = np.concatenate(arrays)
+        self.current.update(X[~named])
+        if named.any():
+            self.current.update(X[named], all_cities[named].astype(str))
+
+    def _run(self):
+        # Everything observed during one interval is binned as a single batch
+        while True:
+            time.sleep(self.flush_seconds)
+            try:
+                self.flush()
+            except Exception as e:
+                # Keep the thread alive; what was drained for the failed flush is lost
+                self.last_error = str(e)
+
+    def flush(self):
+        """Bin everything queued so far (reports call this first)."""
+        with self._lock:
+            self._drain()
+
+    def report(self):
+        """DataFrame of drift and out-of-envelope rates per city and pollutant."""
+        self.flush()
+        rows = []
+        with self._lock:
+            for city, counts in self.current.counts.items():
+                reference = self.reference.counts.get(city, self.reference.counts.get(ALL_CITIES))
+                if reference is None:
+                    continue
+                for j, pollutant in enumerate(POLLUTANTS):
+                    observed = counts[j]
+                    n = int(observed.sum())
+                    if n == 0:
+                        continue
+                    outside = round(100 * (observed[0] + observed[-1]) / n, 2)
+                    if n < self.min_readings:
+                        psi = ks = np.nan
+                        status = 'Insufficient data'
+                    else:
+                        psi = round(population_stability_index(reference[j], observed), 4)
+                        ks = round(binned_ks(reference[j], observed), 4)
+                        status = ('Significant drift' if psi > PSI_SIGNIFICANT
+                                  else 'Moderate drift' if psi > PSI_MODERATE else 'Stable')
+                    rows.append({
+                        'City': city,
+                        'Pollutant': pollutant,
+                        'Readings': n,
+                        'PSI': psi,
+                        'KS': ks,
+                        'Outside Training Range (%)': outside,
+                        'Status': status,
+                    })
+        return pd.DataFrame(rows)
@@ -0,0 +1,280 @@
+# =========================
+# MODEL REGISTRY
+# =========================
+# Versioned model artifacts live under model_registry/:
+#
+#     model_registry/
+#         CURRENT                  {"version": "v0003", "previous": "v0002"}
+#         versions/v0001/model.pkl
+#         versions/v0001/metadata.json
+#         ...
+#
+# metadata.json records the feature list (from model_features.pkl), metrics,
+# a SHA-256 of the training data and the creation time. CURRENT is replaced
+# atomically, so readers always see either the old or the new pointer.
+#
+#     python aqi_registry.py register --model air_pollution_model.pkl --data AQI_Data_2.csv
+#     python aqi_registry.py list
+#     python aqi_registry.py activate v0001
+#     python aqi_registry.py rollback
+import os
+import json
+import time
+import pickle
+import shutil
+import hashlib
+import argparse
+import threading
+
+import numpy as np
+import pandas as pd
+
+REGISTRY_DIR = "model_registry"
+POINTER_FILE = "CURRENT"
+MODEL_FILE = "model.pkl"
+METADATA_FILE = "metadata.json"
+FEATURES_PATH = "model_features.pkl"
+TARGET_COL = 'Overall AQI Value'
+RELOAD_POLL_SECONDS = 5.0
+
+
+def _versions_dir(root):
+    return os.path.join(root, "versions")
+
+
+def _version_names(root):
+    # Skips half-built ".vNNNN.tmp" staging directories
+    versions_dir = _versions_dir(root)
+    if not os.path.isdir(versions_dir):
+        return []
+    return sorted(name for name in os.listdir(versions_dir) if name.startswith("v"))
+
+
+def model_path(version, root=REGISTRY_DIR):
+    return os.path.join(_versions_dir(root), version, MODEL_FILE)
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_json_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+# =========================
+# READING
+# =========================
+def read_pointer(root=REGISTRY_DIR):
+    """Return the CURRENT pointer ({'version', 'previous'}) or None if the registry is empty."""
+    try:
+        with open(os.path.join(root, POINTER_FILE), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def current_version(root=REGISTRY_DIR):
+    pointer = read_pointer(root)
+    return pointer['version'] if pointer else None
+
+
+def list_versions(root=REGISTRY_DIR):
+    """Metadata for every registered version, oldest first."""
+    return [load_metadata(v, root) for v in _version_names(root)]
+
+
+def load_metadata(version, root=REGISTRY_DIR):
+    with open(os.path.join(_versions_dir(root), version, METADATA_FILE), "r") as f:
+        return json.load(f)
+
+
+def load_version(version, root=REGISTRY_DIR):
+    """Return (model, metadata) for a registered version."""
+    with open(model_path(version, root), "rb") as f:
+        model = pickle.load(f)
+    return model, load_metadata(version, root)
+
+
+# =========================
+# WRITING
+# =========================
+def evaluate_model(model, data_path, features):
+    """R², MAE and RMSE of `model` on a CSV that has the feature and target columns."""
+    data = pd.read_csv(data_path)
+    # The raw export marks missing readings with '.', so coerce before dropping them
+    data = data[features + [TARGET_COL]].apply(pd.to_numeric, errors='coerce').dropna()
+    y_true = data[TARGET_COL].to_numpy(dtype=np.float64)
+    y_pred = model.predict(data[features].to_numpy(dtype=np.float64))
+    residual = y_true - y_pred
+    total = ((y_true - y_true.mean()) ** 2).sum()
+    return {
+        'r2': float(1 - (residual ** 2).sum() / total) if total else float('nan'),
+        'mae': float(np.abs(residual).mean()),
+        'rmse': float(np.sqrt((residual ** 2).mean())),
+        'rows': int(len(data)),
+    }
+
+
+def register_model(model_file, data_path=None, metrics=None, features_path=FEATURES_PATH,
+                   root=REGISTRY_DIR, activate=True, extra_metadata=None):
+    """
+    Copy a pickled model into the registry as the next version and return its name.
+
+    If `data_path` is given its hash is recorded and, unless `metrics` is
+    supplied, the model is evaluated on it. `extra_metadata` entries are
+    stored alongside the standard fields.
+    """
+    os.makedirs(_versions_dir(root), exist_ok=True)
+    with open(features_path, "rb") as f:
+        features = list(pickle.load(f))
+
+    if metrics is None and data_path is not None:
+        with open(model_file, "rb") as f:
+            metrics = evaluate_model(pickle.load(f), data_path, features)
+
+    existing = _version_names(root)
+    number = int(existing[-1][1:]) + 1 if existing else 1
+    version = f"v{number:04d}"
+
+    # Build the version in a temp directory and rename it into place in one step
+    staging = os.path.join(_versions_dir(root), f".{version}.tmp")
+    os.makedirs(staging)
+    shutil.copyfile(model_file, os.path.join(staging, MODEL_FILE))
+
+    metadata = {
+        'version': version,
+        'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'source': os.path.abspath(model_file),
+        'features': features,
+        'metrics': metrics or {},
+        'training_data': os.path.abspath(data_path) if data_path else None,
+        'training_data_sha256': file_sha256(data_path) if data_path else None,
+        **(extra_metadata or {}),
+    }
+    _write_json_atomic(os.path.join(staging, METADATA_FILE), metadata)
+    os.rename(staging, os.path.join(_versions_dir(root), version))
+
+    if activate:
+        set_current(version, root)
+    return version
+
+
+def set_current(version, root=REGISTRY_DIR):
+    """Point CURRENT at `version`, remembering the version it replaces."""
+    if not os.path.exists(model_path(version, root)):
+        raise ValueError(f"Unknown model version: {version}")
+    pointer = read_pointer(root)
+    previous = pointer['version'] if pointer else None
+    if previous == version:
+        return
+    _write_json_atomic(os.path.join(root, POINTER_FILE), {'version': version, 'previous': previous})
+
+
+def rollback(root=REGISTRY_DIR):
+    """Re-activate the previously active version and return its name."""
+    pointer = read_pointer(root)
+    if not pointer or not pointer.get('previous'):
+        raise ValueError("No previous version to roll back to")
+    set_current(pointer['previous'], root)
+    return pointer['previous']
+
+
+# =========================
+# BACKGROUND RELOADING
+# =========================
+class ModelWatcher:
+    """
+    Keeps the active model loaded and follows the CURRENT pointer.
+
+    A daemon thread polls the pointer; a new version is fully unpickled before
+    it replaces the active (version, model, metadata, extra) tuple in one
+    assignment, so callers that already fetched the old tuple finish with it
+    undisturbed. `extra` is whatever `on_load(model, metadata)` returns, for
+    state derived from the model at load time.
+    """
+
+    def __init__(self, root=REGISTRY_DIR, poll_seconds=RELOAD_POLL_SECONDS, on_load=None):
+        self.root = root
+        self.poll_seconds = poll_seconds
+        self.on_load = on_load
+        self.active = None
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.check()
+
+    def check(self):
+        """Load the pointed-to version if it differs from the active one."""
+        version = current_version(self.root)
+        if version is None or (self.active and self.active[0] == version):
+            return False
+        try:
+            model, metadata = load_version(version, self.root)
+            extra = self.on_load(model, metadata) if self.on_load else None
+        except Exception as e:
+            # Keep serving the previous version if the new one cannot be loaded
+            self.last_error = f"{version}: {e}"
+            return False
+        self.active = (version, model, metadata, extra)
+        self.last_error = None
+        return True
+
+    def current(self):
+        """Return the active (version, model, metadata, extra) tuple, or None."""
+        return self.active
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="model-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.poll_seconds):
+            self.check()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage versioned AQI model artifacts")
+    parser.add_argument("--root", default=REGISTRY_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    register_cmd = commands.add_parser("register", help="add a model artifact as a new version")
+    register_cmd.add_argument("--model", default="air_pollution_model.pkl")
+    register_cmd.add_argument("--data", default=None, help="training CSV to hash and evaluate on")
+    register_cmd.add_argument("--features", default=FEATURES_PATH)
+    register_cmd.add_argument("--no-activate", action="store_true")
+
+    commands.add_parser("list", help="show registered versions")
+    activate_cmd = commands.add_parser("activate", help="make a version current")
+    activate_cmd.add_argument("version")
+    commands.add_parser("rollback", help="re-activate the previous version")
+
+    args = parser.parse_args()
+    if args.command == "register":
+        new_version = register_model(args.model, args.data, features_path=args.features,
+                                     root=args.root, activate=not args.no_activate)
+        print(f"Registered {new_version}")
+    elif args.command == "list":
+        active = current_version(args.root)
+        for meta in list_versions(args.root):
+            marker = "*" if meta['version'] == active else " "
+            metrics = ", ".join(f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}"
+                                for k, v in meta['metrics'].items())
+            print(f"{marker} {meta['version']}  {meta['created']}  {metrics}")
+    elif args.command == "activate":
+        set_current(args.version, args.root)
+        print(f"Activated {args.version}")
+    elif args.command == "rollback":
+        print(f"Rolled back to {rollback(args.root)}")
@@ -0,0 +1,287 @@
+# =========================
+# INCREMENTAL RETRAINING
+# =========================
+# Updates the random forest as new readings arrive instead of refitting all
+# trees on the full history. Each update grows the forest with warm_start by
+# TREES_PER_PERIOD trees fitted on the new period's readings only, then
+# retires the oldest trees so at most MAX_TREES remain. The forest is a
+# sliding window over the most recent MAX_TREES / TREES_PER_PERIOD periods.
+#
+# A period holds only ~90 readings, often from a subset of cities, so trees
+# fitted on it alone generalise poorly. Each update therefore also replays a
+# random sample of older readings, REPLAY_RATIO times the size of the new
+# data. An update still costs time in proportion to the new data.
+#
+# `tree_periods_` on the model records which period each tree was trained
+# on (trees of a model that predates this module are labelled 'initial').
+# Each period's trees get their own seed derived from the period label:
+# warm start only skips ahead by the number of trees already in the forest,
+# which stops growing once the window is full.
+#
+# `update` registers held-out scores: the same update is first fitted
+# without the most recent HOLDOUT_FRACTION of the new readings and scored
+# on them, next to a full refit on the same rows.
+#
+#     python aqi_retrain.py backtest                       # incremental vs. full refit per quarter
+#     python aqi_retrain.py update --data new_readings.csv --period 2026Q1 --activate
+import os
+import copy
+import time
+import zlib
+import pickle
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+
+import aqi_cleaning
+import aqi_registry
+
+POLLUTANTS = aqi_cleaning.POLLUTANTS
+TARGET_COL = aqi_cleaning.TARGET_COL
+DATE_COL = aqi_cleaning.DATE_COL
+MODEL_PATH = "air_pollution_model.pkl"
+PERIOD_FREQ = 'Q'
+TREES_PER_PERIOD = 10
+MAX_TREES = 100
+REPLAY_RATIO = 3
+RANDOM_STATE = 42
+HOLDOUT_FRACTION = 0.2
+
+
+def new_forest(random_state=RANDOM_STATE):
+    """An empty forest with the notebook's settings, ready for warm-start growth."""
+    model = RandomForestRegressor(n_estimators=TREES_PER_PERIOD, random_state=random_state, warm_start=True)
+    model.tree_periods_ = []
+    return model
+
+
+def tree_periods(model):
+    if not hasattr(model, 'estimators_'):
+        return []
+    return list(getattr(model, 'tree_periods_', ['initial'] * len(model.estimators_)))
+
+
+def period_seed(period, random_state=RANDOM_STATE):
+    """Random state for the trees of one period, so every period draws fresh seeds."""
+    return (random_state + zlib.crc32(str(period).encode('utf-8'))) % (2 ** 32)
+
+
+def add_trees(model, data, period, n_trees=TREES_PER_PERIOD, features=POLLUTANTS):
+    """Fit `n_trees` new trees on `data` alongside the existing ones (warm start)."""
+    existing = tree_periods(model)
+    model.set_params(n_estimators=len(existing) + n_trees, warm_start=True,
+                     random_state=period_seed(period))
+    model.fit(data[features], data[TARGET_COL].to_numpy(dtype=np.float64))
+    model.tree_periods_ = existing + [str(period)] * n_trees
+    return model
+
+
+def retire_oldest(model, max_trees=MAX_TREES):
+    """Drop the oldest trees so at most `max_trees` remain."""
+    periods = tree_periods(model)
+    if len(periods) > max_trees:
+        model.estimators_ = model.estimators_[-max_trees:]
+        model.tree_periods_ = periods[-max_trees:]
+        model.n_estimators = max_trees
+    return model
+
+
+def with_replay(new_data, history, ratio=REPLAY_RATIO, rng=None):
+    """`new_data` plus a uniform sample of `history` of up to `ratio` times its size."""
+    if history is None or len(history) == 0 or ratio <= 0:
+        return new_data
+    rng = rng if rng is not None else np.random.default_rng(RANDOM_STATE)
+    k = min(len(history), int(ratio * len(new_data)))
+    return pd.concat([new_data, history.iloc[rng.choice(len(history), k, replace=False)]], ignore_index=True)
+
+
+def incremental_update(model, data, period, n_trees=TREES_PER_PERIOD, max_trees=MAX_TREES,
+                       features=POLLUTANTS, history=None, replay_ratio=REPLAY_RATIO, rng=None):
+    """Add trees for one new period of readings (plus replayed history) and slide the window forward."""
+    train = with_replay(data, history, replay_ratio, rng)
+    return retire_oldest(add_trees(model, train, period, n_trees, features), max_trees)
+
+
+def full_refit(data, n_trees=MAX_TREES, features=POLLUTANTS, random_state=RANDOM_STATE):
+    """The notebook's approach: every tree refitted on all readings so far."""
+    model = RandomForestRegressor(n_estimators=n_trees, random_state=random_state)
+    model.fit(data[features], data[TARGET_COL].to_numpy(dtype=np.float64))
+    return model
+
+
+def _metrics(model, data, features=POLLUTANTS):
+    # Same fields as aqi_registry.evaluate_model
+    y_true = data[TARGET_COL].to_numpy(dtype=np.float64)
+    residual = y_true - model.predict(data[features])
+    total = ((y_true - y_true.mean()) ** 2).sum()
+    return {
+        'r2': float(1 - (residual ** 2).sum() / total) if total else float('nan'),
+        'mae': float(np.abs(residual).mean()),
+        'rmse': float(np.sqrt((residual ** 2).mean())),
+        'rows': int(len(data)),
+    }
+
+
+def recent_holdout(data, fraction=HOLDOUT_FRACTION):
+    """Split readings into (earlier, most recent `fraction` of dates)."""
+    recent = data[DATE_COL] >= data[DATE_COL].quantile(1 - fraction)
+    return data[~recent], data[recent]
+
+
+def load_training_data(path=aqi_cleaning.RAW_DATA_PATH):
+    """Raw readings, cleaned per city, with rows lacking a target dropped."""
+    cleaned, _ = aqi_cleaning.clean_readings(aqi_cleaning.load_raw(path))
+    return cleaned[cleaned[TARGET_COL].notna() & cleaned[DATE_COL].notna()].reset_index(drop=True)
+
+
+# =========================
+# BACKTEST
+# =========================
+def backtest(data, freq=PERIOD_FREQ, n_trees=TREES_PER_PERIOD, max_trees=MAX_TREES,
+             replay_ratio=REPLAY_RATIO, features=POLLUTANTS):
+    """
+    Replay the history period by period. After each period the incremental
+    forest is updated with that period (plus replayed older readings), and a
+    full refit is trained on everything so far; both are scored on the
+    following period, which neither has seen.
+    """
+    periods = data[DATE_COL].dt.to_period(freq)
+    labels = sorted(periods.unique())
+    model = new_forest()
+    rng = np.random.default_rng(RANDOM_STATE)
+    rows = []
+    for current, following in zip(labels[:-1], labels[1:]):
+        new_data = data[periods == current]
+        seen = data[periods <= current]
+        holdout = data[periods == following]
+
+        started = time.perf_counter()
+        incremental_update(model, new_data, current, n_trees, max_trees, features,
+                           data[periods < current], replay_ratio, rng)
+        incremental_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        refit = full_refit(seen, max_trees, features)
+        refit_seconds = time.perf_counter() - started
+
+        incremental = _metrics(model, holdout, features)
+        full = _metrics(refit, holdout, features)
+        rows.append({
+            'Trained Through': str(current),
+            'Holdout': str(following),
+            'New Rows': len(new_data),
+            'Total Rows': len(seen),
+            'Trees': len(model.estimators_),
+            'Incremental Fit (s)': round(incremental_seconds, 3),
+            'Full Refit (s)': round(refit_seconds, 3),
+            'Incremental R2': round(incremental['r2'], 4),
+            'Full Refit R2': round(full['r2'], 4),
+            'Incremental MAE': round(incremental['mae'], 3),
+            'Full Refit MAE': round(full['mae'], 3),
+        })
+    return pd.DataFrame(rows)
+
+
+# =========================
+# UPDATE + REGISTER
+# =========================
+def load_base_model(model_file=None, root=aqi_registry.REGISTRY_DIR):
+    """The model to update: an explicit file, else the registry's current version, else the shipped model."""
+    if model_file is None:
+        version = aqi_registry.current_version(root)
+        if version is not None:
+            return aqi_registry.load_version(version, root)[0]
+        model_file = MODEL_PATH
+    with open(model_file, "rb") as f:
+        return pickle.load(f)
+
+
+def holdout_comparison(base_model, new_data, period, history=None, n_trees=TREES_PER_PERIOD,
+                       max_trees=MAX_TREES, replay_ratio=REPLAY_RATIO, fraction=HOLDOUT_FRACTION):
+    """
+    Fit the update without the most recent `fraction` of `new_data`, and a
+    full refit on the history plus the same rows; score both on the held-out
+    readings. Returns None if the new data doesn't span enough dates to split.
+    """
+    train, holdout = recent_holdout(new_data, fraction)
+    if len(train) == 0 or len(holdout) == 0:
+        return None
+    candidate = incremental_update(copy.deepcopy(base_model), train, period, n_trees, max_trees,
+                                   history=history, replay_ratio=replay_ratio)
+    seen = pd.concat([history, train], ignore_index=True) if history is not None else train
+    return {
+        'start': str(holdout[DATE_COL].min().date()),
+        'end': str(holdout[DATE_COL].max().date()),
+        'incremental': _metrics(candidate, holdout),
+        'full_refit': _metrics(full_refit(seen, max_trees), holdout),
+    }
+
+
+def update_and_register(data_path, period, model_file=None, history_path=None, n_trees=TREES_PER_PERIOD,
+                        max_trees=MAX_TREES, replay_ratio=REPLAY_RATIO, root=aqi_registry.REGISTRY_DIR,
+                        activate=True, holdout_fraction=HOLDOUT_FRACTION):
+    """
+    Grow the base model with one period of new readings and register it as a
+    new version. The registered metrics are the held-out scores from
+    holdout_comparison (empty if the new data couldn't be split).
+    """
+    history = load_training_data(history_path) if history_path else None
+    new_data = load_training_data(data_path)
+    base_model = load_base_model(model_file, root)
+    comparison = holdout_comparison(base_model, new_data, period, history, n_trees, max_trees,
+                                    replay_ratio, holdout_fraction)
+    model = incremental_update(base_model, new_data, period, n_trees, max_trees,
+                               history=history, replay_ratio=replay_ratio)
+    fd, staged = tempfile.mkstemp(suffix=".pkl")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(model, f)
+        return aqi_registry.register_model(staged, data_path, root=root, activate=activate,
+                                           metrics=comparison['incremental'] if comparison else {},
+                                           extra_metadata={'tree_periods': model.tree_periods_,
+                                                           'update_period': str(period),
+                                                           'holdout': comparison})
+    finally:
+        os.remove(staged)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sliding-window incremental retraining of the AQI forest")
+    parser.add_argument("--trees-per-period", type=int, default=TREES_PER_PERIOD)
+    parser.add_argument("--max-trees", type=int, default=MAX_TREES)
+    parser.add_argument("--replay-ratio", type=float, default=REPLAY_RATIO,
+                        help="older readings replayed per new reading")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backtest_cmd = commands.add_parser("backtest", help="compare incremental updates with full refits")
+    backtest_cmd.add_argument("--data", default=aqi_cleaning.RAW_DATA_PATH)
+    backtest_cmd.add_argument("--freq", default=PERIOD_FREQ, help="pandas period alias of one update (Q, M, ...)")
+
+    update_cmd = commands.add_parser("update", help="add trees for new readings and register the result")
+    update_cmd.add_argument("--data", required=True, help="raw CSV with the new period's readings")
+    update_cmd.add_argument("--period", required=True, help="label recorded for the new trees, e.g. 2026Q1")
+    update_cmd.add_argument("--history", default=aqi_cleaning.RAW_DATA_PATH,
+                            help="older readings to replay from ('' to disable)")
+    update_cmd.add_argument("--model", default=None, help="base model (default: registry's current version)")
+    update_cmd.add_argument("--root", default=aqi_registry.REGISTRY_DIR)
+    update_cmd.add_argument("--activate", action="store_true", help="make the new version current")
+    update_cmd.add_argument("--holdout", type=float, default=HOLDOUT_FRACTION,
+                            help="share of the newest readings held out to score the update")
+    args = parser.parse_args()
+
+    if args.command == "backtest":
+        report = backtest(load_training_data(args.data), args.freq, args.trees_per_period, args.max_trees,
+                          args.replay_ratio)
+        print(report.to_string(index=False))
+        print(f"\nMean holdout R2: incremental {report['Incremental R2'].mean():.4f}, "
+              f"full refit {report['Full Refit R2'].mean():.4f}; "
+              f"fit time: incremental {report['Incremental Fit (s)'].sum():.1f}s, "
+              f"full refit {report['Full Refit (s)'].sum():.1f}s")
+    else:
+        version = update_and_register(args.data, args.period, args.model, args.history or None,
+                                      args.trees_per_period, args.max_trees, args.replay_ratio, args.root,
+                                      activate=args.activate, holdout_fraction=args.holdout)
+        print(f"Registered {version}" + (" (active)" if args.activate else ""))
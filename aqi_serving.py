@@ -0,0 +1,376 @@
+# =========================
+# MULTI-PROCESS MODEL SERVING
+# =========================
+# Runs N worker processes that all accept connections on one local HTTP port.
+# The forest from air_pollution_model.pkl is flattened (see aqi_forest) into a
+# single shared memory block, which every worker maps instead of unpickling
+# its own copy of the model.
+#
+# The parent process watches the model file. When a new artifact appears it
+# is written to a fresh block and the shared generation counter is bumped;
+# each worker switches over before its next request, so requests already in
+# progress finish on the old weights. Old blocks are unlinked after a grace
+# period.
+#
+#     python aqi_serving.py --workers 4 --port 8502
+#     python aqi_serving.py --registry model_registry   # follow the registry's CURRENT version
+#
+#     POST /predict  {"instances": [[CO, Ozone, PM10, PM25, NO2], ...]}
+#                    or {"instances": [{"CO": 5.0, "Ozone": 30.0, ...}, ...]}
+#                    add "intervals": true for per-tree spread, 5%/95% quantiles
+#                    and the probability of exceeding each AQI category boundary;
+#                    add "explain": true for per-feature contributions;
+#                    a top-level "city" or a per-instance "city" / site name
+#                    attributes the inputs to a city for drift monitoring
+#     GET  /export?start=2021-01-01&end=2021-12-31&cities=Delhi,Hyderabad&columns=PM10
+#                 &format=csv|ndjson|parquet&compression=none|gzip|zstd&predict=1
+#                    streams filtered history (optionally with predictions) via aqi_export
+#     GET  /drift     this worker's input drift report (see aqi_monitoring)
+#     GET  /health
+import os
+import sys
+import json
+import time
+import pickle
+import signal
+import socket
+import argparse
+import threading
+import multiprocessing as mp
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import numpy as np
+
+import aqi_registry
+import aqi_categories
+import aqi_export
+import aqi_monitoring
+from aqi_forest import ForestArrays, PathExplainer
+
+MODEL_PATH = "air_pollution_model.pkl"
+FEATURES_PATH = "model_features.pkl"
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8502
+POLL_SECONDS = 2.0
+SWAP_GRACE_SECONDS = 10.0
+
+
+def load_forest(model_path=MODEL_PATH, version=None, features_path=FEATURES_PATH):
+    """
+    Unpickle the model artifact and flatten it; the version defaults to the
+    file's mtime. A model fitted without feature names takes them from
+    `features_path`.
+    """
+    with open(model_path, "rb") as file:
+        model = pickle.load(file)
+    if version is None:
+        version = time.strftime("%Y%m%d-%H%M%S", time.localtime(os.path.getmtime(model_path)))
+    forest = ForestArrays.from_model(model, version=version)
+    if forest.feature_names is None:
+        with open(features_path, "rb") as file:
+            forest.feature_names = list(pickle.load(file))
+    return forest
+
+
+def _block_name(prefix, generation):
+    # Block names are derived from the generation so workers only share one integer
+    return f"{prefix}_{generation}"
+
+
+def _artifact_stamp(model_path, registry=None):
+    """Something that changes whenever a new artifact should be served."""
+    if registry is not None:
+        return aqi_registry.current_version(registry)
+    try:
+        stat = os.stat(model_path)
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
+
+
+def _load_artifact(model_path, registry=None):
+    if registry is not None:
+        version = aqi_registry.current_version(registry)
+        if version is None:
+            raise FileNotFoundError(f"No active version in registry '{registry}'")
+        return load_forest(aqi_registry.model_path(version, registry), version=version)
+    return load_forest(model_path)
+
+
+# =========================
+# WORKER PROCESS
+# =========================
+class _WorkerModel:
+    def __init__(self, prefix, generation):
+        self.prefix = prefix
+        self.generation = generation
+        self.current = -1
+        self.forest = None
+        self.block = None
+        self._explainer = None
+
+    def refresh(self):
+        """Attach to the newest published block if the generation has moved on."""
+        generation = self.generation.value
+        if generation == self.current:
+            return self.forest
+        forest, block = ForestArrays.from_shared_memory(_block_name(self.prefix, generation))
+        old_block = self.block
+        self.forest, self.block, self.current = forest, block, generation
+        self._explainer = None
+        if old_block is not None:
+            try:
+                old_block.close()
+            except BufferError:
+                pass
+        return self.forest
+
+    def explainer(self):
+        # Built on first use per model version; per-node totals take milliseconds to compute
+        if self._explainer is None or self._explainer.forest is not self.forest:
+            self._explainer = PathExplainer(self.forest)
+        return self._explainer
+
+
+def _parse_instances(payload, feature_names):
+    instances = payload.get("instances", [])
+    if not instances:
+        return np.empty((0, len(feature_names)))
+    if isinstance(instances[0], dict):
+        return np.array([[row[name] for name in feature_names] for row in instances], dtype=np.float64)
+    X = np.array(instances, dtype=np.float64).reshape(len(instances), -1)
+    if X.shape[1] != len(feature_names):
+        raise ValueError(f"expected {len(feature_names)} values per instance ({', '.join(feature_names)})")
+    return X
+
+
+def _parse_cities(payload):
+    """City of the instances for drift monitoring: one name, a list per instance, or None."""
+    if isinstance(payload.get("city"), str):
+        return payload["city"]
+    instances = payload.get("instances", [])
+    if instances and isinstance(instances[0], dict):
+        cities = [row.get("city", row.get(aqi_monitoring.SITE_COL)) for row in instances]
+        if any(city is not None for city in cities):
+            return cities
+    return None
+
+
+def _interval_response(forest, X):
+    if not len(X):
+        return {"predictions": [], "std": [], "lower": [], "upper": [], "exceedance": []}
+    distribution = forest.predict_distribution(X, thresholds=aqi_categories.CATEGORY_BOUNDARIES)
+    lower, upper = (distribution['quantiles'][q] for q in sorted(distribution['quantiles']))
+    # exceedance[i][name] = share of trees predicting above the lower edge of `name`
+    exceedance = [dict(zip(aqi_categories.CATEGORY_NAMES[1:], row)) for row in distribution['exceedance'].tolist()]
+    return {
+        "predictions": distribution['mean'].tolist(),
+        "std": distribution['std'].tolist(),
+        "lower": lower.tolist(),
+        "upper": upper.tolist(),
+        "exceedance": exceedance,
+    }
+
+
+def _make_handler(worker_model, drift_monitor=None):
+    class PredictionHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path == "/export":
+                self._export(parse_qs(url.query))
+                return
+            if url.path == "/drift":
+                self._drift()
+                return
+            if url.path != "/health":
+                self._send_json(404, {"error": "not found"})
+                return
+            forest = worker_model.refresh()
+            self._send_json(200, {"status": "ok", "pid": os.getpid(), "model_version": forest.version})
+
+        def _drift(self):
+            if drift_monitor is None:
+                self._send_json(404, {"error": "drift monitoring unavailable (training data not found)"})
+                return
+            report = drift_monitor.report()
+            self._send_json(200, {"pid": os.getpid(), "dropped": drift_monitor.dropped,
+                                  "report": json.loads(report.to_json(orient="records"))})
+
+        def _export(self, query):
+            def param(name, default=None):
+                return query.get(name, [default])[0]
+
+            fmt = param("format", "csv")
+            compression = param("compression", "none")
+            if fmt not in aqi_export.FORMATS or compression not in aqi_export.COMPRESSIONS:
+                self._send_json(400, {"error": "unsupported format or compression"})
+                return
+            columns = [c for c in param("columns", "Overall AQI Value").split(",") if c]
+            cities = [c for c in param("cities", "").split(",") if c]
+
+            forest = worker_model.refresh()
+            predict = param("predict", "").lower() in ("1", "true", "yes", "on")
+            if predict:
+                columns += [c for c in forest.feature_names if c not in columns]
+            chunks = aqi_export.iter_chunks(columns, param("start"), param("end"), cities)
+            if predict:
+                chunks = aqi_export.with_predictions(chunks, forest, forest.feature_names)
+
+            # No Content-Length: the body is streamed until the connection closes
+            self.send_response(200)
+            self.send_header("Content-Type", aqi_export.MIME_TYPES[fmt])
+            self.send_header("Content-Disposition", "attachment; filename="
+                             + aqi_export.export_filename("aqi_export", fmt, compression))
+            self.end_headers()
+            try:
+                aqi_export.write_export(self.wfile, chunks, fmt, compression)
+            except (ValueError, KeyError) as e:
+                # Headers are already sent; all that can be done is to stop the stream
+                self.log_error("export failed: %s", e)
+
+        def do_POST(self):
+            if self.path != "/predict":
+                self._send_json(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if not isinstance(payload, dict):
+                    raise ValueError("request body must be a JSON object")
+                forest = worker_model.refresh()
+                X = _parse_instances(payload, forest.feature_names)
+                if drift_monitor is not None and len(X) and set(aqi_monitoring.POLLUTANTS) <= set(forest.feature_names):
+                    columns = [forest.feature_names.index(name) for name in aqi_monitoring.POLLUTANTS]
+                    drift_monitor.observe(X[:, columns], _parse_cities(payload))
+                if payload.get("intervals"):
+                    body = _interval_response(forest, X)
+                else:
+                    body = {"predictions": forest.predict(X).tolist() if len(X) else []}
+                if payload.get("explain"):
+                    explainer = worker_model.explainer()
+                    contributions = explainer.explain(X) if len(X) else np.empty((0, explainer.n_features))
+                    body["bias"] = explainer.bias
+                    body["contributions"] = [dict(zip(forest.feature_names, row)) for row in contributions.tolist()]
+            except (ValueError, KeyError, TypeError) as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            body["model_version"] = forest.version
+            self._send_json(200, body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return PredictionHandler
+
+
+def _worker_main(listen_socket, prefix, generation):
+    # Ctrl+C is handled by the parent, which then terminates the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker_model = _WorkerModel(prefix, generation)
+    worker_model.refresh()
+    # Each worker monitors the inputs it serves; the binning thread must start in this process
+    drift_monitor = aqi_monitoring.default_monitor()
+
+    server = HTTPServer(listen_socket.getsockname()[:2], _make_handler(worker_model, drift_monitor),
+                        bind_and_activate=False)
+    server.socket = listen_socket
+    server.serve_forever()
+
+
+# =========================
+# PARENT PROCESS
+# =========================
+def serve(model_path=MODEL_PATH, host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None, ready=None,
+          registry=None):
+    """
+    Serve predictions until interrupted. `ready` (an Event) is set once workers are up.
+
+    With `registry`, the registry's CURRENT version is served instead of `model_path`.
+    """
+    workers = workers or os.cpu_count() or 1
+    prefix = f"aqi_forest_{os.getpid()}"
+    generation = mp.RawValue('i', 0)
+
+    forest = _load_artifact(model_path, registry)
+    blocks = {0: forest.to_shared_memory(_block_name(prefix, 0))}
+    retired = []
+    stamp = _artifact_stamp(model_path, registry)
+
+    listen_socket = socket.create_server((host, port), backlog=1024)
+    processes = []
+
+    def start_worker():
+        process = mp.Process(target=_worker_main, args=(listen_socket, prefix, generation), daemon=True)
+        process.start()
+        return process
+
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+
+    try:
+        processes = [start_worker() for _ in range(workers)]
+        print(f"Serving model {forest.version} on http://{host}:{port} with {workers} workers")
+        if ready is not None:
+            ready.set()
+
+        while True:
+            time.sleep(POLL_SECONDS)
+
+            # Replace workers that died
+            for i, process in enumerate(processes):
+                if not process.is_alive():
+                    processes[i] = start_worker()
+
+            # Hot-swap when the artifact on disk changes
+            new_stamp = _artifact_stamp(model_path, registry)
+            if new_stamp is not None and new_stamp != stamp:
+                try:
+                    new_forest = _load_artifact(model_path, registry)
+                except Exception as e:
+                    print(f"Model reload failed, keeping {forest.version}: {e}")
+                else:
+                    next_generation = generation.value + 1
+                    blocks[next_generation] = new_forest.to_shared_memory(_block_name(prefix, next_generation))
+                    retired.append((generation.value, time.monotonic()))
+                    generation.value = next_generation
+                    forest = new_forest
+                    print(f"Swapped to model {forest.version}")
+                stamp = new_stamp
+
+            # Unlink old blocks once every worker has had time to move off them
+            while retired and time.monotonic() - retired[0][1] > SWAP_GRACE_SECONDS:
+                old_generation, _ = retired.pop(0)
+                block = blocks.pop(old_generation)
+                block.close()
+                block.unlink()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+        listen_socket.close()
+        for block in blocks.values():
+            block.close()
+            block.unlink()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve AQI predictions from several processes")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--registry", default=None, help="serve the active version of this model registry")
+    args = parser.parse_args()
+    serve(args.model, args.host, args.port, args.workers, registry=args.registry)
@@ -0,0 +1,228 @@
+# =========================
+# SPATIAL AQI INTERPOLATION
+# =========================
+# Monitoring sites are located through site_locations.json (lat/lon per site
+# name used in the data). AQI is interpolated onto a regular lat/lon grid by
+# inverse distance weighting over the k nearest stations.
+#
+# The station layout is fixed, so the KD-tree lookup and the IDW weights for
+# every grid cell are computed once and kept as a sparse (cells x stations)
+# matrix. Interpolating any number of days is then two sparse products: the
+# weighted sum of the stations that reported, divided by their total weight.
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from scipy.sparse import csr_matrix
+from scipy.spatial import cKDTree
+
+from aqi_categories import AQI_CATEGORIES
+
+SITE_LOCATIONS_PATH = "site_locations.json"
+SITE_COL = 'Site Name (of Overall AQI)'
+DATE_COL = 'Date'
+VALUE_COL = 'Overall AQI Value'
+GRID_SHAPE = (120, 120)
+NEIGHBOURS = 8
+IDW_POWER = 2.0
+BOUNDS_PADDING_DEG = 1.5
+CACHE_DAYS = 1024
+KM_PER_DEG_LAT = 110.57
+KM_PER_DEG_LON = 111.32
+
+
+def load_site_registry(path=SITE_LOCATIONS_PATH):
+    """DataFrame indexed by site name with 'lat' and 'lon' columns."""
+    with open(path, 'r') as f:
+        sites = json.load(f)
+    registry = pd.DataFrame.from_dict(sites, orient='index')
+    registry.index.name = SITE_COL
+    return registry
+
+
+def _project(lat, lon, ref_lat):
+    # Equirectangular projection to km; accurate enough for neighbour ranking
+    return np.column_stack([
+        np.asarray(lon) * KM_PER_DEG_LON * np.cos(np.radians(ref_lat)),
+        np.asarray(lat) * KM_PER_DEG_LAT,
+    ])
+
+
+class IDWGrid:
+    """Precomputed IDW weights from a fixed set of stations to a regular grid."""
+
+    def __init__(self, site_registry, shape=GRID_SHAPE, bounds=None,
+                 neighbours=NEIGHBOURS, power=IDW_POWER):
+        self.site_names = list(site_registry.index)
+        lat = site_registry['lat'].to_numpy(dtype=np.float64)
+        lon = site_registry['lon'].to_numpy(dtype=np.float64)
+
+        if bounds is None:
+            bounds = (lat.min() - BOUNDS_PADDING_DEG, lat.max() + BOUNDS_PADDING_DEG,
+                      lon.min() - BOUNDS_PADDING_DEG, lon.max() + BOUNDS_PADDING_DEG)
+        lat_min, lat_max, lon_min, lon_max = bounds
+        self.lats = np.linspace(lat_min, lat_max, shape[0])
+        self.lons = np.linspace(lon_min, lon_max, shape[1])
+        self.shape = shape
+
+        ref_lat = (lat_min + lat_max) / 2
+        grid_lat, grid_lon = np.meshgrid(self.lats, self.lons, indexing='ij')
+        tree = cKDTree(_project(lat, lon, ref_lat))
+        k = min(neighbours, len(self.site_names))
+        distance, index = tree.query(_project(grid_lat.ravel(), grid_lon.ravel(), ref_lat), k=k)
+        if k == 1:
+            distance, index = distance[:, None], index[:, None]
+
+        weights = 1.0 / np.maximum(distance, 1e-6) ** power
+        rows = np.repeat(np.arange(len(index)), k)
+        self.weights = csr_matrix((weights.ravel(), (rows, index.ravel())),
+                                  shape=(len(index), len(self.site_names)))
+
+    def interpolate(self, values):
+        """
+        Interpolate station values onto the grid.
+
+        `values` is (n_sites,) or (n_days, n_sites), aligned with `site_names`;
+        NaN marks a missing reading. Returns (lat, lon) or (n_days, lat, lon).
+        """
+        values = np.asarray(values, dtype=np.float64)
+        single = values.ndim == 1
+        values = np.atleast_2d(values)
+
+        valid = ~np.isnan(values)
+        weighted_sum = self.weights @ np.where(valid, values, 0.0).T
+        total_weight = self.weights @ valid.T.astype(np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            grid = (weighted_sum / total_weight).T
+        grid = grid.reshape((len(values),) + self.shape)
+        return grid[0] if single else grid
+
+
+class SpatialAQIEngine:
+    """
+    AQI grids for a history of station readings. Results are cached per date
+    (and per requested range), holding at most `cache_days` grids in total.
+    The engine is shared by all sessions, so the cache is guarded by a lock.
+    """
+
+    def __init__(self, history, grid, value_col=VALUE_COL, cache_days=CACHE_DAYS):
+        self.grid = grid
+        self.value_col = value_col
+        # Days x sites table in the grid's station order; sites without coordinates are dropped
+        daily = history.assign(**{DATE_COL: pd.to_datetime(history[DATE_COL]).dt.normalize()})
+        table = daily.pivot_table(index=DATE_COL, columns=SITE_COL, values=value_col,
+                                  aggfunc='mean', observed=True)
+        self.table = table.reindex(columns=grid.site_names)
+        self.dates = self.table.index
+        self.cache_days = cache_days
+        self._cache = OrderedDict()
+        self._cached_grids = 0
+        self._lock = threading.Lock()
+
+    def _cached(self, key, compute, size):
+        # LRU over single days and whole ranges, bounded by the number of grids held. Grids are
+        # computed outside the lock; two sessions missing the same key both compute it once.
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key][0]
+        result = compute()
+        with self._lock:
+            if key in self._cache:
+                self._cached_grids -= self._cache.pop(key)[1]
+            self._cache[key] = (result, size(result))
+            self._cached_grids += self._cache[key][1]
+            while self._cached_grids > self.cache_days and len(self._cache) > 1:
+                _, (_, evicted) = self._cache.popitem(last=False)
+                self._cached_grids -= evicted
+        return result
+
+    def grid_for(self, date):
+        """Interpolated grid for one date (NaN everywhere if no station reported)."""
+        date = pd.Timestamp(date).normalize()
+
+        def compute():
+            if date in self.dates:
+                values = self.table.loc[date].to_numpy(dtype=np.float64)
+            else:
+                values = np.full(len(self.grid.site_names), np.nan)
+            return self.grid.interpolate(values)
+
+        return self._cached(date, compute, lambda result: 1)
+
+    def grids_for_range(self, start, end, freq='D'):
+        """
+        Grids for every period in [start, end], averaging station readings per
+        period first. Periods are labelled by their first day (a 'W-MON' week
+        runs Monday to Sunday). Returns (period starts, array of shape
+        (periods, lat, lon)).
+        """
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+
+        def compute():
+            window = self.table.loc[start:end]
+            if freq != 'D':
+                window = window.resample(freq, label='left', closed='left').mean()
+            # Periods in which no station reported would be blank grids
+            window = window.dropna(how='all')
+            return window.index, self.grid.interpolate(window.to_numpy(dtype=np.float64))
+
+        return self._cached((start, end, freq), compute, lambda result: max(len(result[0]), 1))
+
+
+# =========================
+# RENDERING
+# =========================
+AQI_SCALE_MAX = 500
+
+
+def aqi_colorscale():
+    """Plotly colorscale that steps through the AQI category colors over 0-500."""
+    bounds = [0] + [min(c[0], AQI_SCALE_MAX) for c in AQI_CATEGORIES]
+    scale = []
+    for (lower, upper), color in zip(zip(bounds[:-1], bounds[1:]), [c[2] for c in AQI_CATEGORIES]):
+        scale.append([lower / AQI_SCALE_MAX, color])
+        scale.append([upper / AQI_SCALE_MAX, color])
+    return scale
+
+
+def _heatmap_trace(grid_values, grid):
+    # Whole AQI points are plenty for colour and keep animation payloads small
+    return go.Heatmap(z=np.round(grid_values), x=grid.lons, y=grid.lats, zmin=0, zmax=AQI_SCALE_MAX,
+                      colorscale=aqi_colorscale(), colorbar=dict(title="AQI"),
+                      hovertemplate="lat %{y:.2f}, lon %{x:.2f}<br>AQI %{z:.0f}<extra></extra>")
+
+
+def heatmap_figure(grid_values, grid, site_registry, title):
+    """Interpolated grid as a heatmap with the monitoring stations marked."""
+    fig = go.Figure(_heatmap_trace(grid_values, grid))
+    fig.add_trace(go.Scatter(x=site_registry['lon'], y=site_registry['lat'], mode='markers+text',
+                             text=list(site_registry.index), textposition='top center',
+                             marker=dict(color='black', size=8), showlegend=False,
+                             hoverinfo='text'))
+    fig.update_layout(title=title, xaxis_title="Longitude", yaxis_title="Latitude",
+                      yaxis_scaleanchor="x", height=650)
+    return fig
+
+
+def animated_heatmap_figure(periods, grids, grid, site_registry, title):
+    """One frame per period, with a play button and a period slider."""
+    fig = heatmap_figure(grids[0], grid, site_registry, title)
+    labels = [pd.Timestamp(p).strftime('%Y-%m-%d') for p in periods]
+    fig.frames = [go.Frame(data=[_heatmap_trace(g, grid)], traces=[0], name=label)
+                  for g, label in zip(grids, labels)]
+    fig.update_layout(
+        updatemenus=[dict(type='buttons', showactive=False, buttons=[
+            dict(label='▶ Play', method='animate',
+                 args=[None, dict(frame=dict(duration=300, redraw=True), fromcurrent=True)]),
+            dict(label='⏸ Pause', method='animate',
+                 args=[[None], dict(frame=dict(duration=0, redraw=False), mode='immediate')]),
+        ])],
+        sliders=[dict(steps=[dict(method='animate', label=label,
+                                  args=[[label], dict(mode='immediate', frame=dict(duration=0, redraw=True))])
+                             for label in labels])],
+    )
+    return fig
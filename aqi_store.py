@@ -0,0 +1,208 @@
+# =========================
+# PARTITIONED HISTORY STORE
+# =========================
+# Historical readings are kept on disk as Parquet files laid out as
+#
+#     aqi_history_store/site=<city>/year=<yyyy>/part-<n>.parquet
+#
+# plus a small `_manifest.json` describing every partition (site, year,
+# date range, row count). Queries prune partitions from the manifest using
+# the requested cities and date range before any file is opened, and only the
+# requested columns are read from the files that survive. Readings may be
+# daily or sub-daily (hourly); timestamps are stored at full resolution.
+#
+# Build (or rebuild) the store from the processed CSV with:
+#
+#     python aqi_store.py aqi_visualization_data.csv
+import os
+import sys
+import json
+import time
+import shutil
+from urllib.parse import quote
+
+import pandas as pd
+
+STORE_DIR = "aqi_history_store"
+MANIFEST_FILE = "_manifest.json"
+SITE_COL = 'Site Name (of Overall AQI)'
+DATE_COL = 'Date'
+CSV_CHUNK_ROWS = 500_000
+
+
+def _partition_dir(root, site, year):
+    return os.path.join(root, f"site={quote(str(site), safe='')}", f"year={int(year)}")
+
+
+def load_manifest(root=STORE_DIR):
+    """Return the store manifest, or None if no store has been built."""
+    try:
+        with open(os.path.join(root, MANIFEST_FILE), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_manifest(root, manifest):
+    # Write to a temp file and rename so readers never see a half-written manifest
+    manifest['version'] = time.time()
+    tmp_path = os.path.join(root, MANIFEST_FILE + ".tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(root, MANIFEST_FILE))
+
+
+def _compact(frame):
+    # Hourly history is 24x the rows of daily; single precision halves it on disk and in memory
+    floats = frame.select_dtypes('float64').columns
+    return frame.astype({col: 'float32' for col in floats})
+
+
+def write_partitions(data, root=STORE_DIR, manifest=None, save=True):
+    """Append a DataFrame of readings to the store, one file per (site, year)."""
+    if manifest is None:
+        manifest = load_manifest(root) or {'partitions': [], 'columns': []}
+
+    data = data.dropna(subset=[DATE_COL, SITE_COL])
+    value_cols = [c for c in data.columns if c != SITE_COL]
+    for col in value_cols:
+        if col not in manifest['columns']:
+            manifest['columns'].append(col)
+
+    index = {(p['site'], p['year']): p for p in manifest['partitions']}
+    for (site, year), part in data.groupby([data[SITE_COL], data[DATE_COL].dt.year], sort=False):
+        path = _partition_dir(root, site, year)
+        os.makedirs(path, exist_ok=True)
+
+        entry = index.get((site, int(year)))
+        if entry is None:
+            entry = {'site': site, 'year': int(year), 'files': [], 'rows': 0,
+                     'min_date': None, 'max_date': None}
+            index[(site, int(year))] = entry
+            manifest['partitions'].append(entry)
+
+        # The site is encoded in the directory name, so it is not stored again
+        file_name = f"part-{len(entry['files'])}.parquet"
+        _compact(part[value_cols]).sort_values(DATE_COL).to_parquet(os.path.join(path, file_name), index=False)
+
+        part_min = part[DATE_COL].min().isoformat()
+        part_max = part[DATE_COL].max().isoformat()
+        entry['files'].append(file_name)
+        entry['rows'] += len(part)
+        entry['min_date'] = min(filter(None, [entry['min_date'], part_min]))
+        entry['max_date'] = max(filter(None, [entry['max_date'], part_max]))
+
+    if save:
+        _save_manifest(root, manifest)
+    return manifest
+
+
+def build_store(csv_path="aqi_visualization_data.csv", root=STORE_DIR):
+    """
+    Rebuild the store from a CSV in bounded-size chunks. The new store is
+    written beside the old one and swapped in when complete, so running the
+    build again replaces the history instead of appending a second copy.
+    """
+    staging = root.rstrip(os.sep) + ".building"
+    retired = root.rstrip(os.sep) + ".old"
+    for path in (staging, retired):
+        shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(staging)
+
+    manifest = {'partitions': [], 'columns': []}
+    for chunk in pd.read_csv(csv_path, parse_dates=[DATE_COL], chunksize=CSV_CHUNK_ROWS):
+        manifest = write_partitions(chunk, staging, manifest, save=False)
+    _save_manifest(staging, manifest)
+
+    if os.path.exists(root):
+        os.replace(root, retired)
+    os.replace(staging, root)
+    shutil.rmtree(retired, ignore_errors=True)
+    return manifest
+
+
+def store_summary(manifest):
+    """
+    Return (min_date, max_date, sorted cities) without touching any data file,
+    or None if the store holds no partitions.
+    """
+    partitions = manifest['partitions']
+    if not partitions:
+        return None
+    min_date = pd.Timestamp(min(p['min_date'] for p in partitions)).date()
+    max_date = pd.Timestamp(max(p['max_date'] for p in partitions)).date()
+    cities = sorted({p['site'] for p in partitions})
+    return min_date, max_date, cities
+
+
+def prune_partitions(manifest, start=None, end=None, cities=None):
+    """Return the manifest entries that can contain rows matching the filters."""
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) + pd.Timedelta(days=1) if end is not None else None
+    cities = set(cities) if cities else None
+
+    selected = []
+    for p in manifest['partitions']:
+        if cities is not None and p['site'] not in cities:
+            continue
+        if start is not None and pd.Timestamp(p['max_date']) < start:
+            continue
+        if end is not None and pd.Timestamp(p['min_date']) >= end:
+            continue
+        selected.append(p)
+    return selected
+
+
+def iter_history(columns, start=None, end=None, cities=None, root=STORE_DIR, manifest=None):
+    """
+    Yield one DataFrame per surviving partition file with `columns` plus Date
+    and site. `start` and `end` are inclusive dates.
+    """
+    if manifest is None:
+        manifest = load_manifest(root)
+        if manifest is None:
+            return
+
+    read_cols = [DATE_COL] + [c for c in dict.fromkeys(columns) if c not in (DATE_COL, SITE_COL)]
+    start_ts = pd.Timestamp(start) if start is not None else None
+    end_ts = pd.Timestamp(end) + pd.Timedelta(days=1) if end is not None else None
+
+    for p in prune_partitions(manifest, start, end, cities):
+        path = _partition_dir(root, p['site'], p['year'])
+        for file_name in p['files']:
+            frame = pd.read_parquet(os.path.join(path, file_name), columns=read_cols)
+            # Only partitions straddling the range boundary need a row filter
+            if start_ts is not None and pd.Timestamp(p['min_date']) < start_ts:
+                frame = frame[frame[DATE_COL] >= start_ts]
+            if end_ts is not None and pd.Timestamp(p['max_date']) >= end_ts:
+                frame = frame[frame[DATE_COL] < end_ts]
+            yield frame.assign(**{SITE_COL: p['site']})
+
+
+def query_history(columns, start=None, end=None, cities=None, root=STORE_DIR, manifest=None):
+    """
+    Read `columns` (plus Date and site) for the given date range and cities.
+
+    `start` and `end` are inclusive dates. Returns None if no store exists.
+    """
+    if manifest is None:
+        manifest = load_manifest(root)
+        if manifest is None:
+            return None
+
+    frames = list(iter_history(columns, start, end, cities, root, manifest))
+    if not frames:
+        read_cols = [DATE_COL] + [c for c in dict.fromkeys(columns) if c not in (DATE_COL, SITE_COL)]
+        return pd.DataFrame(columns=read_cols + [SITE_COL])
+
+    result = pd.concat(frames, ignore_index=True)
+    result[SITE_COL] = result[SITE_COL].astype('category')
+    return result
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else "aqi_visualization_data.csv"
+    target = sys.argv[2] if len(sys.argv) > 2 else STORE_DIR
+    built = build_store(source, target)
+    print(f"Store '{target}': {len(built['partitions'])} partitions, "
+          f"{sum(p['rows'] for p in built['partitions']):,} rows")
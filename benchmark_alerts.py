@@ -0,0 +1,100 @@
+# =========================
+# ALERTING BENCHMARK
+# =========================
+# Feeds synthetic hourly readings for many cities through aqi_alerts and
+# reports sustained readings/sec, both calling the engine directly at several
+# micro-batch sizes and end to end through the queue the stream sources use.
+# Each pass over the readings is shifted past the previous one in time, since
+# the engine drops readings older than the ones it has already seen.
+#
+#     python benchmark_alerts.py --cities 200 --seconds 5
+import time
+import queue
+import pickle
+import argparse
+import threading
+
+import numpy as np
+import pandas as pd
+
+import aqi_alerts
+from aqi_forest import ForestArrays
+
+# Training-data ranges from pollutant_statistics.json (CO, Ozone, PM10, PM25, NO2)
+FEATURE_LOW = np.array([1.0, 1.0, 1.0, 4.0, 2.0])
+FEATURE_HIGH = np.array([18.0, 185.0, 67.0, 166.0, 72.0])
+
+
+def synthetic_readings(n, n_cities, features, seed=0):
+    """Hourly readings round-robin over `n_cities` cities, as a DataFrame."""
+    rng = np.random.default_rng(seed)
+    X = rng.uniform(FEATURE_LOW, FEATURE_HIGH, size=(n, len(features))).round(2)
+    readings = pd.DataFrame(X, columns=features)
+    readings[aqi_alerts.SITE_COL] = [f"City {i % n_cities}" for i in range(n)]
+    readings[aqi_alerts.DATE_COL] = pd.Timestamp("2024-01-01") + pd.to_timedelta(np.arange(n) // n_cities, unit='h')
+    return readings
+
+
+def time_span(readings):
+    """Offset that moves a copy of the readings past the original, one hour later."""
+    dates = pd.to_datetime(readings[aqi_alerts.DATE_COL])
+    return dates.max() - dates.min() + pd.Timedelta(hours=1)
+
+
+def bench_direct(forest, readings, batch, seconds):
+    engine = aqi_alerts.AlertEngine(forest, sink=aqi_alerts.ListSink())
+    span = time_span(readings)
+    processed, passes, started = 0, 0, time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        shifted = readings.assign(**{aqi_alerts.DATE_COL: readings[aqi_alerts.DATE_COL] + passes * span})
+        for i in range(0, len(shifted), batch):
+            chunk = shifted.iloc[i:i + batch]
+            engine.process(chunk)
+            processed += len(chunk)
+        passes += 1
+    elapsed = time.perf_counter() - started
+    return processed / elapsed, len(engine.sink.alerts)
+
+
+def bench_queue(forest, readings, seconds):
+    engine = aqi_alerts.AlertEngine(forest, sink=aqi_alerts.ListSink())
+    span = time_span(readings)
+    incoming, stop = queue.Queue(maxsize=4 * aqi_alerts.BATCH_ROWS), threading.Event()
+    consumer = threading.Thread(target=engine.run, args=(incoming, stop), daemon=True)
+    consumer.start()
+    passes, started = 0, time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        # Records as the stream sources produce them, with string dates
+        shifted = readings[aqi_alerts.DATE_COL] + passes * span
+        records = readings.assign(**{aqi_alerts.DATE_COL: shifted.astype(str)}).to_dict(orient='records')
+        for record in records:
+            incoming.put(record)
+        passes += 1
+    while not incoming.empty():
+        time.sleep(0.01)
+    stop.set()
+    consumer.join()
+    elapsed = time.perf_counter() - started
+    return engine.readings / elapsed, len(engine.sink.alerts)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure sustained aqi_alerts throughput")
+    parser.add_argument("--model", default="air_pollution_model.pkl")
+    parser.add_argument("--cities", type=int, default=200)
+    parser.add_argument("--rows", type=int, default=50_000, help="distinct synthetic readings")
+    parser.add_argument("--seconds", type=float, default=5.0, help="duration of each measurement")
+    parser.add_argument("--batches", type=int, nargs="*", default=[256, 1024, 4096])
+    args = parser.parse_args()
+
+    with open(args.model, "rb") as f:
+        forest = ForestArrays.from_model(pickle.load(f))
+    readings = synthetic_readings(args.rows, args.cities, forest.feature_names)
+
+    print(f"{'mode':>14} {'readings/s':>12} {'alerts':>8}")
+    for batch in args.batches:
+        rate, alerts = bench_direct(forest, readings, batch, args.seconds)
+        print(f"{'batch ' + str(batch):>14} {rate:>12,.0f} {alerts:>8}")
+
+    rate, alerts = bench_queue(forest, readings, args.seconds)
+    print(f"{'queue':>14} {rate:>12,.0f} {alerts:>8}")
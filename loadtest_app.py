@@ -0,0 +1,324 @@
+# =========================
+# DASHBOARD LOAD TEST
+# =========================
+# Starts `streamlit run aqi_app.py` headless and drives it with N concurrent
+# sessions. Each session is a websocket client that speaks the browser's
+# protocol (BackMsg rerun requests with widget states, ForwardMsg deltas back).
+# The server does the same work it would for real users: one script run per
+# interaction, with caches shared across sessions.
+#
+# Every session moves through Home, AQI Prediction (enter readings, predict),
+# Historical Data (pick cities and a pollutant, apply, change aggregation) and
+# City Analysis (pick a city), with a short think time between steps. The
+# report has latency percentiles per step and the server's CPU time and RSS
+# (read from /proc, so Linux only).
+#
+#     python loadtest_app.py --sessions 20 --rounds 3
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+import multiprocessing as mp
+import urllib.request
+from urllib.parse import quote
+
+import numpy as np
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from websockets.asyncio.client import connect
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "aqi_app.py")
+WIDGET_TYPES = ('button', 'selectbox', 'multiselect', 'number_input', 'radio', 'checkbox')
+STEP_TIMEOUT_SECONDS = 120
+SAMPLE_SECONDS = 0.5
+
+# Training-data ranges from pollutant_statistics.json, keyed by input label
+PREDICTION_INPUTS = {
+    "Enter CO value:": (1.0, 18.0),
+    "Enter Ozone value:": (1.0, 185.0),
+    "Enter PM10 value:": (1.0, 67.0),
+    "Enter PM2.5 value:": (4.0, 166.0),
+    "Enter NO2 value:": (2.0, 72.0),
+}
+
+
+# =========================
+# SESSION CLIENT
+# =========================
+class AppSession:
+    """One browser-like session: remembers widget ids and values between reruns."""
+
+    def __init__(self, url):
+        self.url = url
+        self.ws = None
+        self.page = "Home"
+        self.widgets = {}      # (type, label) -> element proto
+        self.values = {}       # widget id -> WidgetState kept across reruns
+        self.triggers = []     # one-shot WidgetStates (button clicks)
+
+    async def open(self):
+        self.ws = await connect(self.url, subprotocols=["streamlit"], max_size=None)
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+
+    def widget(self, kind, label):
+        return self.widgets.get((kind, label))
+
+    def set_value(self, kind, label, value):
+        element = self.widget(kind, label)
+        if element is None:
+            return False
+        state = BackMsg().rerun_script.widget_states.widgets.add()
+        state.id = element.id
+        if kind in ('selectbox', 'radio'):
+            state.string_value = value
+        elif kind == 'multiselect':
+            state.string_array_value.data.extend(value)
+        elif kind == 'number_input':
+            state.double_value = float(value)
+        elif kind == 'checkbox':
+            state.bool_value = bool(value)
+        self.values[element.id] = state
+        return True
+
+    def click(self, label):
+        element = self.widget('button', label)
+        if element is None:
+            return False
+        state = BackMsg().rerun_script.widget_states.widgets.add()
+        state.id = element.id
+        state.trigger_value = True
+        self.triggers.append(state)
+        return True
+
+    async def rerun(self, page=None):
+        """Request a script run and wait for it to finish; returns (seconds, errors)."""
+        self.page = page or self.page
+        message = BackMsg()
+        message.rerun_script.query_string = f"page={quote(self.page)}"
+        for state in list(self.values.values()) + self.triggers:
+            message.rerun_script.widget_states.widgets.add().CopyFrom(state)
+        self.triggers = []
+
+        started = time.perf_counter()
+        await self.ws.send(message.SerializeToString())
+        widgets, errors = {}, []
+        while True:
+            forward = ForwardMsg()
+            forward.ParseFromString(await asyncio.wait_for(self.ws.recv(), STEP_TIMEOUT_SECONDS))
+            kind = forward.WhichOneof('type')
+            if kind == 'delta' and forward.delta.WhichOneof('type') == 'new_element':
+                element = forward.delta.new_element
+                element_type = element.WhichOneof('type')
+                if element_type in WIDGET_TYPES:
+                    widget = getattr(element, element_type)
+                    widgets[(element_type, widget.label)] = widget
+                elif element_type == 'exception':
+                    errors.append(element.exception.message)
+            elif kind == 'script_finished':
+                # st.rerun() inside the script ends one run early and starts another
+                if forward.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    break
+                widgets = {}
+        elapsed = time.perf_counter() - started
+
+        # Like the browser, only send state for widgets that are still on screen
+        self.widgets = widgets
+        live = {w.id for w in widgets.values()}
+        self.values = {wid: state for wid, state in self.values.items() if wid in live}
+        return elapsed, errors
+
+
+# =========================
+# SCENARIO
+# =========================
+async def user_journey(session, rng, think_seconds, record):
+    """One pass through the four pages with typical widget interactions."""
+    async def step(name, page=None):
+        elapsed, errors = await session.rerun(page)
+        record(name, elapsed, errors)
+        await asyncio.sleep(rng.uniform(0, 2 * think_seconds))
+
+    await step("Home", "Home")
+
+    await step("AQI Prediction", "AQI Prediction")
+    for label, (low, high) in PREDICTION_INPUTS.items():
+        session.set_value('number_input', label, round(rng.uniform(low, high), 1))
+    if session.click("Predict AQI"):
+        await step("AQI Prediction: predict")
+
+    await step("Historical Data", "Historical Data")
+    cities = session.widget('multiselect', "Select Cities:")
+    pollutants = session.widget('selectbox', "Select Pollutant:")
+    if cities is not None and pollutants is not None:
+        session.set_value('multiselect', "Select Cities:",
+                          rng.sample(list(cities.options), rng.randint(1, len(cities.options))))
+        session.set_value('selectbox', "Select Pollutant:", rng.choice(list(pollutants.options)))
+        if session.click("Apply Filters & Analyze"):
+            await step("Historical Data: apply")
+        aggregation = session.widget('radio', "Aggregation:")
+        if aggregation is not None:
+            session.set_value('radio', "Aggregation:", rng.choice(list(aggregation.options)))
+            await step("Historical Data: aggregation")
+
+    await step("City Analysis", "City Analysis")
+    city = session.widget('selectbox', "Select a City:")
+    if city is not None:
+        session.set_value('selectbox', "Select a City:", rng.choice(list(city.options)))
+        await step("City Analysis: select city")
+
+
+async def run_sessions(url, n_sessions, rounds, think_seconds, seed):
+    records = []
+
+    def record(name, elapsed, errors):
+        records.append((name, elapsed, len(errors), errors[0] if errors else None))
+
+    async def one(i):
+        rng = random.Random(seed + i)
+        session = AppSession(url)
+        # Stagger arrivals so sessions don't all start in the same instant
+        await asyncio.sleep(rng.uniform(0, think_seconds))
+        try:
+            await session.open()
+            for _ in range(rounds):
+                await user_journey(session, rng, think_seconds, record)
+        except Exception as e:
+            records.append(("session failed", 0.0, 1, f"{type(e).__name__}: {e}"))
+        finally:
+            await session.close()
+
+    await asyncio.gather(*(one(i) for i in range(n_sessions)))
+    return records
+
+
+def _client_process(url, n_sessions, rounds, think_seconds, seed, start_event, results):
+    start_event.wait()
+    results.put(asyncio.run(run_sessions(url, n_sessions, rounds, think_seconds, seed)))
+
+
+# =========================
+# SERVER
+# =========================
+def _proc_cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    # utime and stime are fields 14 and 15 of /proc/<pid>/stat
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def _proc_rss_mib(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return float('nan')
+
+
+def start_server(port, app_path=APP_PATH):
+    server = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", app_path, "--server.headless", "true",
+         "--server.port", str(port), "--browser.gatherUsageStats", "false"],
+        cwd=os.path.dirname(app_path), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    return server
+        except OSError:
+            time.sleep(0.3)
+    server.terminate()
+    raise RuntimeError("Streamlit server did not become healthy")
+
+
+def summarize(records):
+    by_step = {}
+    for name, elapsed, errors, message in records:
+        entry = by_step.setdefault(name, {'latencies': [], 'errors': 0, 'message': None})
+        entry['latencies'].append(elapsed * 1000)
+        entry['errors'] += errors
+        entry['message'] = entry['message'] or message
+    return by_step
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent session load test for the Streamlit dashboard")
+    parser.add_argument("--sessions", type=int, default=10, help="concurrent simulated users")
+    parser.add_argument("--rounds", type=int, default=3, help="passes through the pages per session")
+    parser.add_argument("--think", type=float, default=0.5, help="mean pause between interactions (s)")
+    parser.add_argument("--client-procs", type=int, default=1,
+                        help="client processes to spread sessions over (keeps the client off the critical path)")
+    parser.add_argument("--port", type=int, default=8601)
+    parser.add_argument("--url", help="drive an already running server instead (no CPU/RSS report)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = None if args.url else start_server(args.port)
+    url = args.url or f"ws://127.0.0.1:{args.port}/_stcore/stream"
+    samples = []
+    try:
+        if server is not None:
+            samples.append((time.perf_counter(), _proc_cpu_seconds(server.pid), _proc_rss_mib(server.pid)))
+        # One quiet pass first so the measured runs see warm caches, like a server that has been up a while
+        asyncio.run(run_sessions(url, 1, 1, 0.0, args.seed - 1))
+
+        start_event = mp.Event()
+        results = mp.Queue()
+        shares = [len(part) for part in np.array_split(np.arange(args.sessions), args.client_procs)]
+        clients = [mp.Process(target=_client_process,
+                              args=(url, share, args.rounds, args.think, args.seed + 1000 * i, start_event, results))
+                   for i, share in enumerate(shares) if share]
+        for p in clients:
+            p.start()
+
+        if server is not None:
+            samples.append((time.perf_counter(), _proc_cpu_seconds(server.pid), _proc_rss_mib(server.pid)))
+        started = time.perf_counter()
+        start_event.set()
+        collected = []
+        while len(collected) < len(clients):
+            try:
+                collected.append(results.get(timeout=SAMPLE_SECONDS))
+            except Exception:
+                pass
+            if server is not None:
+                samples.append((time.perf_counter(), _proc_cpu_seconds(server.pid), _proc_rss_mib(server.pid)))
+        duration = time.perf_counter() - started
+        for p in clients:
+            p.join()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    records = [r for chunk in collected for r in chunk]
+    steps = summarize(records)
+    print(f"{args.sessions} sessions x {args.rounds} rounds in {duration:.1f}s "
+          f"({len(records) / duration:.1f} script runs/s)\n")
+    print(f"{'step':<30} {'runs':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'errors':>6}")
+    for name, entry in steps.items():
+        latencies = np.asarray(entry['latencies'])
+        print(f"{name:<30} {len(latencies):>5} {np.percentile(latencies, 50):>8.0f} "
+              f"{np.percentile(latencies, 95):>8.0f} {np.percentile(latencies, 99):>8.0f} "
+              f"{latencies.max():>8.0f} {entry['errors']:>6}")
+    for name, entry in steps.items():
+        if entry['message']:
+            print(f"  {name}: {entry['message'][:200]}")
+
+    if len(samples) >= 3:
+        _, cold_cpu, cold_rss = samples[0]
+        load_start, warm_cpu, warm_rss = samples[1]
+        load_end, end_cpu, end_rss = samples[-1]
+        peak_rss = max(s[2] for s in samples[1:])
+        cpu = end_cpu - warm_cpu
+        print(f"\nServer CPU under load: {cpu:.1f}s ({100 * cpu / max(load_end - load_start, 1e-9):.0f}% of one core)")
+        print(f"Server RSS: {cold_rss:.0f} MiB at start, {warm_rss:.0f} MiB after warm-up, "
+              f"{peak_rss:.0f} MiB peak, {end_rss:.0f} MiB at end "
+              f"(+{end_rss - warm_rss:.0f} MiB during the load)")
@@ -0,0 +1,125 @@
+# =========================
+# SERVING LOAD TEST
+# =========================
+# Starts aqi_serving with 1, 2, 4, ... up to all cores and measures
+# throughput with a fixed pool of client processes, so the scaling from
+# extra workers is visible in one table.
+#
+#     python loadtest_serving.py --seconds 10 --batch 32
+import os
+import json
+import time
+import argparse
+import http.client
+import multiprocessing as mp
+
+import numpy as np
+
+import aqi_serving
+
+# Training-data ranges from pollutant_statistics.json (CO, Ozone, PM10, PM25, NO2)
+FEATURE_LOW = np.array([1.0, 1.0, 1.0, 4.0, 2.0])
+FEATURE_HIGH = np.array([18.0, 185.0, 67.0, 166.0, 72.0])
+
+
+def _client(port, batch, seconds, start_event, results):
+    rng = np.random.default_rng(os.getpid())
+    start_event.wait()
+    deadline = time.perf_counter() + seconds
+    requests = errors = 0
+    latencies = []
+    while time.perf_counter() < deadline:
+        rows = rng.uniform(FEATURE_LOW, FEATURE_HIGH, size=(batch, len(FEATURE_LOW)))
+        body = json.dumps({"instances": rows.round(2).tolist()})
+        started = time.perf_counter()
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            conn.request("POST", "/predict", body, {"Content-Type": "application/json"})
+            response = conn.getresponse()
+            response.read()
+            conn.close()
+            if response.status != 200:
+                errors += 1
+                continue
+        except OSError:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+        requests += 1
+    results.put((requests, errors, latencies))
+
+
+def _wait_healthy(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def run_level(workers, clients, batch, seconds, port, model_path):
+    server = mp.Process(target=aqi_serving.serve,
+                        kwargs=dict(model_path=model_path, port=port, workers=workers))
+    server.start()
+    try:
+        if not _wait_healthy(port):
+            raise RuntimeError(f"server with {workers} workers did not become healthy")
+
+        start_event = mp.Event()
+        results = mp.Queue()
+        procs = [mp.Process(target=_client, args=(port, batch, seconds, start_event, results))
+                 for _ in range(clients)]
+        for p in procs:
+            p.start()
+        start_event.set()
+        collected = [results.get() for _ in procs]
+        for p in procs:
+            p.join()
+    finally:
+        server.terminate()
+        server.join()
+
+    requests = sum(r[0] for r in collected)
+    errors = sum(r[1] for r in collected)
+    latencies = np.concatenate([np.asarray(r[2]) for r in collected]) * 1000
+    return {
+        'workers': workers,
+        'req_per_s': requests / seconds,
+        'rows_per_s': requests * batch / seconds,
+        'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else float('nan'),
+        'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else float('nan'),
+        'errors': errors,
+    }
+
+
+def worker_levels(max_workers):
+    levels, n = [], 1
+    while n < max_workers:
+        levels.append(n)
+        n *= 2
+    return levels + [max_workers]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure aqi_serving throughput from 1 to all cores")
+    parser.add_argument("--model", default=aqi_serving.MODEL_PATH)
+    parser.add_argument("--port", type=int, default=8599)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--batch", type=int, default=32, help="rows per request")
+    parser.add_argument("--clients", type=int, default=os.cpu_count() * 2)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    print(f"{'workers':>7} {'req/s':>9} {'rows/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'errors':>6} {'scaling':>8}")
+    baseline = None
+    for workers in worker_levels(args.max_workers):
+        result = run_level(workers, args.clients, args.batch, args.seconds, args.port, args.model)
+        baseline = baseline or result['req_per_s']
+        print(f"{result['workers']:>7} {result['req_per_s']:>9.1f} {result['rows_per_s']:>10.0f} "
+              f"{result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['errors']:>6} "
+              f"{result['req_per_s'] / baseline:>7.2f}x")
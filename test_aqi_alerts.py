@@ -0,0 +1,121 @@
+# =========================
+# ALERTING ENGINE TESTS
+# =========================
+# Rule evaluation in aqi_alerts with a stand-in model whose predicted AQI is
+# the CO value of the reading, so each test chooses the category directly.
+#
+#     python -m pytest -q test_aqi_alerts.py
+import numpy as np
+import pandas as pd
+
+import aqi_alerts
+from aqi_alerts import AlertEngine, AlertRule, ListSink
+
+POLLUTANTS = ['CO', 'Ozone', 'PM10', 'PM25', 'NO2']
+GOOD, SENSITIVE, UNHEALTHY = 30.0, 130.0, 180.0
+
+
+class EchoForest:
+    feature_names = POLLUTANTS
+
+    def predict(self, X):
+        return X[:, 0]
+
+
+def reading(hour, aqi, city="Delhi"):
+    return {'Date': (pd.Timestamp("2024-01-01") + pd.Timedelta(hours=hour)).isoformat(),
+            aqi_alerts.SITE_COL: city, 'CO': aqi, 'Ozone': 1.0, 'PM10': 1.0, 'PM25': 1.0, 'NO2': 1.0}
+
+
+def make_engine(*rules):
+    rules = rules or [AlertRule("Unhealthy 3h", "Unhealthy", window=3)]
+    return AlertEngine(EchoForest(), rules, sink=ListSink())
+
+
+def fired_hours(alerts):
+    return [pd.Timestamp(alert['date']).hour for alert in alerts]
+
+
+def test_consecutive_hours_fire_once():
+    engine = make_engine()
+    alerts = engine.process([reading(h, UNHEALTHY) for h in range(6)])
+    assert fired_hours(alerts) == [2]
+
+
+def test_refires_after_recovery():
+    engine = make_engine()
+    hours = [UNHEALTHY] * 3 + [GOOD] + [UNHEALTHY] * 3
+    alerts = engine.process([reading(h, aqi) for h, aqi in enumerate(hours)])
+    assert fired_hours(alerts) == [2, 6]
+
+
+def test_gaps_break_the_window():
+    engine = make_engine()
+    assert engine.process([reading(h, UNHEALTHY) for h in (0, 5, 10)]) == []
+
+
+def test_refires_after_missed_reading():
+    engine = make_engine(AlertRule("Unhealthy reading", "Unhealthy", window=1))
+    alerts = engine.process([reading(h, UNHEALTHY) for h in (0, 1, 5)])
+    assert fired_hours(alerts) == [0, 5]
+
+
+def test_out_of_order_batch_is_sorted_by_time():
+    engine = make_engine()
+    batch = [reading(2, UNHEALTHY), reading(0, GOOD), reading(1, UNHEALTHY), reading(3, UNHEALTHY)]
+    assert fired_hours(engine.process(batch)) == [3]
+    assert engine.late == 0
+
+
+def test_run_split_across_batches():
+    engine = make_engine()
+    assert engine.process([reading(0, UNHEALTHY), reading(1, UNHEALTHY)]) == []
+    assert fired_hours(engine.process([reading(2, UNHEALTHY)])) == [2]
+    assert engine.process([reading(3, UNHEALTHY)]) == []
+
+
+def test_late_and_duplicate_readings_are_dropped():
+    engine = make_engine()
+    engine.process([reading(0, UNHEALTHY), reading(1, UNHEALTHY)])
+    alerts = engine.process([reading(1, UNHEALTHY), reading(0, UNHEALTHY), reading(1, GOOD)])
+    assert alerts == []
+    assert engine.late == 3
+    assert engine.readings == 2
+    assert fired_hours(engine.process([reading(2, UNHEALTHY)])) == [2]
+
+
+def test_min_count_of_window():
+    engine = make_engine(AlertRule("Sensitive 6 of 8", "Unhealthy for Sensitive Groups", window=8, min_count=6))
+    hours = [SENSITIVE, GOOD, SENSITIVE, SENSITIVE, GOOD, SENSITIVE, SENSITIVE, SENSITIVE]
+    alerts = engine.process([reading(h, aqi) for h, aqi in enumerate(hours)])
+    assert fired_hours(alerts) == [7]
+
+
+def test_malformed_readings_are_skipped():
+    engine = make_engine()
+    batch = [reading(h, UNHEALTHY) for h in range(3)]
+    batch.insert(1, dict(reading(5, UNHEALTHY), CO="n/a"))
+    batch.insert(2, dict(reading(6, UNHEALTHY), Date="not a date"))
+    batch.append({'CO': UNHEALTHY})
+    assert fired_hours(engine.process(batch)) == [2]
+    assert engine.readings == 3
+
+
+def test_cities_are_independent():
+    engine = make_engine()
+    batch = []
+    for h in range(3):
+        batch += [reading(h, UNHEALTHY, "Delhi"), reading(h, GOOD if h == 1 else UNHEALTHY, "Mumbai")]
+    alerts = engine.process(batch)
+    assert [(alert['city'], pd.Timestamp(alert['date']).hour) for alert in alerts] == [("Delhi", 2)]
+
+
+def test_dataframe_input_and_history_growth():
+    engine = AlertEngine(EchoForest(), [AlertRule("Unhealthy 3h", "Unhealthy", window=3)],
+                         sink=ListSink(), initial_cities=2)
+    cities = [f"City {i}" for i in range(5)]
+    frame = pd.DataFrame([reading(h, UNHEALTHY, city) for h in range(3) for city in cities])
+    frame['Date'] = pd.to_datetime(frame['Date'])
+    alerts = engine.process(frame)
+    assert sorted(alert['city'] for alert in alerts) == cities
+    assert np.all(engine.history_times[:5, -1] == pd.Timestamp("2024-01-01 02:00").value)